@@ -0,0 +1,7 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+from sinara_mgmt.cli import main
+
+main()
@@ -0,0 +1,181 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`aio`
+====================================================
+
+asyncio front-end for Kasli discovery and monitoring.
+
+Blocking FTDI work is run in a single-threaded executor per Kasli bus,
+shared by every ``AsyncKasli`` wrapping it, so operations on one crate are
+serialized while different crates proceed concurrently. Long operations
+are split into short executor jobs where they are not already batched (e.g.
+one job per DIOT slot), so cancellation and ``asyncio.wait_for()`` timeouts
+take effect between bus transactions instead of after the whole operation.
+
+* Author(s): Jakub Matyas
+"""
+
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from sinara_mgmt.chips.eeprom_24aa025e48 import EE24AA02XEXX
+from sinara_mgmt.chips.lm75 import LM75
+from sinara_mgmt.kasli import KasliI2C, SFPStatus
+from sinara_mgmt.sinara import Sinara
+
+T = TypeVar("T")
+
+
+# executor of every Kasli bus with wrappers and the number of its wrappers
+_bus_executors = weakref.WeakKeyDictionary()
+_bus_executors_lock = threading.Lock()
+
+
+def _acquire_bus_executor(kasli: KasliI2C) -> ThreadPoolExecutor:
+    with _bus_executors_lock:
+        entry = _bus_executors.get(kasli)
+        if entry is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kasli-bus")
+            entry = _bus_executors[kasli] = [executor, 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def _release_bus_executor(kasli: KasliI2C) -> Optional[ThreadPoolExecutor]:
+    # returns the executor once its last wrapper released it
+    with _bus_executors_lock:
+        entry = _bus_executors[kasli]
+        entry[1] -= 1
+        if entry[1]:
+            return None
+        del _bus_executors[kasli]
+        return entry[0]
+
+
+def _close_constructed(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, future.result().close)
+
+
+class AsyncKasli:
+    """Async wrapper of a ``KasliI2C`` (or ``KasliDIOT``) instance.
+
+    All wrappers of the same Kasli share its bus executor, which keeps
+    operations on the crate's bus from overlapping; a different
+    ``executor`` can be given explicitly instead.
+    """
+
+    def __init__(
+        self, kasli: KasliI2C, executor: Optional[ThreadPoolExecutor] = None
+    ) -> None:
+        self.kasli = kasli
+        self._shared = executor is None
+        if self._shared:
+            executor = _acquire_bus_executor(kasli)
+        self._executor = executor
+        self._closed = False
+
+    @classmethod
+    async def open(cls, kasli_cls=KasliI2C, **kwargs) -> "AsyncKasli":
+        """Construct ``kasli_cls(**kwargs)`` (which opens the FTDI and sets
+        up the expanders) without blocking the event loop.
+
+        The construction itself cannot be interrupted: if ``open()`` is
+        cancelled, the Kasli is closed as soon as it is constructed.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, functools.partial(kasli_cls, **kwargs))
+        try:
+            kasli = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(_close_constructed)
+            raise
+        return cls(kasli)
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run blocking ``func`` in the crate's executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def discover_peripherals(self) -> List[Tuple[Sinara, int]]:
+        """Async ``KasliI2C.discover_peripherals()`` - a single executor job,
+        as the discovery is batched into a few USB round trips."""
+        await self.run(self.kasli.discover_peripherals)
+        return self.kasli.eem_peripherals
+
+    async def discover_diot_peripherals(self) -> list:
+        """Async ``KasliDIOT.discover_peripherals()``, slot by slot."""
+        occupied = await self.run(self.kasli.probe_diot_slots)
+        for slot in range(8):
+            if occupied & (1 << slot):
+                await self.run(self.kasli.discover_slot, slot)
+            else:
+                await self.run(self.kasli.drop_peripheral, slot)
+        return self.kasli.diot_peripherals
+
+    async def read_eeprom(self, eeprom: Optional[EE24AA02XEXX] = None) -> bytes:
+        """Contents of ``eeprom`` (Kasli's on-board EEPROM by default)."""
+        if eeprom is None:
+            eeprom = self.kasli.eeprom
+        return bytes(await self.run(lambda: eeprom.contents))
+
+    async def sinara_eeprom(self) -> Sinara:
+        return Sinara.unpack(await self.read_eeprom())
+
+    async def eui48(self) -> List[int]:
+        return await self.run(lambda: self.kasli.eeprom.eui48)
+
+    async def sfp_status(self, sfp: int) -> SFPStatus:
+        """Pin levels of SFP cage ``sfp`` (0-3)."""
+        sfpio = getattr(self.kasli, f"sfpio{sfp}")
+        return await self.run(lambda: sfpio.status)
+
+    async def read_temperature(self, sensor: LM75) -> float:
+        return await self.run(lambda: sensor.temperature)
+
+    async def read_temperatures(self, sensors: Dict[str, LM75]) -> Dict[str, float]:
+        """Temperatures of named ``sensors``, one executor job per sensor."""
+        return {
+            name: await self.read_temperature(sensor)
+            for name, sensor in sensors.items()
+        }
+
+    async def close(self) -> None:
+        """Wait for pending bus operations and shut the executor down (a
+        shared one once all wrappers of the Kasli are closed)."""
+        if self._closed:
+            return
+        self._closed = True
+        executor = self._executor
+        if self._shared:
+            executor = _release_bus_executor(self.kasli)
+        if executor is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, executor.shutdown)
+
+    async def __aenter__(self) -> "AsyncKasli":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+
+async def gather_crates(
+    crates: Sequence[AsyncKasli], method: str, *args, **kwargs
+) -> list:
+    """Call async ``method`` of every crate concurrently, e.g.
+    ``await gather_crates(crates, "discover_peripherals")``.
+    """
+    return await asyncio.gather(
+        *(getattr(crate, method)(*args, **kwargs) for crate in crates)
+    )
@@ -0,0 +1,70 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`bus_recovery`
+====================================================
+
+Recovery of an I2C bus held by a slave, done directly with MPSSE commands
+of the pyftdi ``I2cController`` behind Blinka's FTDI I2C interface.
+
+A slave interrupted mid-transfer (e.g. by a glitch) can keep SDA low while
+it waits for the rest of its byte; clocking SCL until it releases SDA and
+issuing a STOP condition returns it to idle. The FTDI GPIO pins on the same
+port keep their levels and directions throughout.
+
+* Author(s): Jakub Matyas
+"""
+
+from typing import Optional
+
+from pyftdi.ftdi import Ftdi
+from pyftdi.i2c import I2cController
+
+# SCL pulses needed to finish any byte (8 data bits and ACK)
+RECOVERY_PULSES = 9
+
+
+def find_controller(i2c) -> Optional[I2cController]:
+    """pyftdi controller behind ``i2c`` (e.g. Blinka's ``_I2C`` or a trace
+    recording wrapping it), or None if ``i2c`` is not backed by an FTDI.
+    """
+    while i2c is not None and not isinstance(i2c, I2cController):
+        i2c = getattr(i2c, "_i2c", None)
+    return i2c
+
+
+def _set_bits_low(controller: I2cController, scl: bool) -> bytes:
+    # SDA released (input), SCL driven, GPIO pins unchanged
+    value = (controller.SCL_BIT if scl else 0) | controller._gpio_low
+    direction = controller.SCL_BIT | (controller._gpio_dir & 0xFF)
+    return bytes((Ftdi.SET_BITS_LOW, value, direction))
+
+
+def sda_low(controller: I2cController) -> bool:
+    """Check whether SDA is held low with the bus idle (SCL high)."""
+    cmd = bytearray(_set_bits_low(controller, scl=True))
+    cmd.extend((Ftdi.GET_BITS_LOW,))
+    cmd.extend(controller._idle)
+    cmd.extend((Ftdi.SEND_IMMEDIATE,))
+    with controller._lock:
+        controller.ftdi.write_data(cmd)
+        data = controller.ftdi.read_data_bytes(1, 4)
+    if len(data) != 1:
+        raise OSError("Cannot read I2C bus state")
+    return not data[0] & controller.SDA_I_BIT
+
+
+def clock_out(controller: I2cController, pulses: int = RECOVERY_PULSES) -> None:
+    """Clock SCL ``pulses`` times with SDA released, then issue a STOP,
+    all in a single USB write.
+    """
+    delay = controller._ck_delay
+    low = _set_bits_low(controller, scl=False) * delay
+    high = _set_bits_low(controller, scl=True) * delay
+    cmd = bytearray((low + high) * pulses)
+    cmd.extend(controller._clk_lo_data_lo)
+    cmd.extend(controller._stop)
+    with controller._lock:
+        controller.ftdi.write_data(cmd)
@@ -11,7 +11,7 @@ Digital input/output of the PCA9539.
 * Author(s): Jakub Matyas
 """
 
-from typing import Optional
+from typing import Iterable, Optional
 
 import digitalio
 
@@ -60,16 +60,18 @@ class DigitalInOut:
         """Switch the pin state to a digital output with the provided starting
         value (True/False for high or low, default is False/low).
         """
-        self.direction = digitalio.Direction.OUTPUT
-        self.value = value
+        with self._pca.batch():
+            self.value = value
+            self.direction = digitalio.Direction.OUTPUT
 
     def switch_to_input(self, invert_polarity: bool = False, **kwargs) -> None:
         """Switch the pin state to a digital input with the provided starting
         pull-up resistor state (optional, no pull-up by default) and input polarity.  Note that
         pull-down resistors are NOT supported!
         """
-        self.direction = digitalio.Direction.INPUT
-        self.invert_polarity = invert_polarity
+        with self._pca.batch():
+            self.direction = digitalio.Direction.INPUT
+            self.invert_polarity = invert_polarity
 
     # pylint: enable=unused-argument
 
@@ -83,10 +85,11 @@ class DigitalInOut:
 
     @value.setter
     def value(self, val: bool) -> None:
+        # output register is shadowed by the driver - single bus write
         if val:
-            self._pca.gpio = _enable_bit(self._pca.gpio, self._pin)
+            self._pca.output = _enable_bit(self._pca.output, self._pin)
         else:
-            self._pca.gpio = _clear_bit(self._pca.gpio, self._pin)
+            self._pca.output = _clear_bit(self._pca.output, self._pin)
 
     @property
     def direction(self) -> bool:
@@ -119,13 +122,112 @@ class DigitalInOut:
         """The polarity of the pin, either True for an Inverted or
         False for an normal.
         """
-        if _get_bit(self._pca.ipol, self._pin):
+        if _get_bit(self._pca.polinv, self._pin):
             return True
         return False
 
     @invert_polarity.setter
     def invert_polarity(self, val: bool) -> None:
         if val:
-            self._pca.ipol = _enable_bit(self._pca.ipol, self._pin)
+            self._pca.polinv = _enable_bit(self._pca.polinv, self._pin)
         else:
-            self._pca.ipol = _clear_bit(self._pca.ipol, self._pin)
+            self._pca.polinv = _clear_bit(self._pca.polinv, self._pin)
+
+
+class PinGroup:
+    """A group of pins of the same PCA9539 accessed as a bit vector, where
+    bit N of the value corresponds to the N-th pin of the group.
+
+    Reading the group costs a single input register read, writing it (or
+    some of its pins, see ``write()``) a single masked output register write,
+    and the direction of all (or some, see ``set_direction()``) pins is
+    changed with at most one configuration register write.
+    """
+
+    def __init__(self, pin_numbers: Iterable[int], PCA9539: PCA9539Base) -> None:
+        self._pins = tuple(pin_numbers)
+        self._pca = PCA9539
+        self.mask = 0
+        for pin in self._pins:
+            self.mask = _enable_bit(self.mask, pin)
+        if len(self._pins) != bin(self.mask).count("1"):
+            raise ValueError("Pin numbers in a group must be unique.")
+
+    def __len__(self) -> int:
+        return len(self._pins)
+
+    def __getitem__(self, index: int) -> DigitalInOut:
+        return DigitalInOut(self._pins[index], self._pca)
+
+    def _decode(self, register: int) -> int:
+        val = 0
+        for bit, pin in enumerate(self._pins):
+            if _get_bit(register, pin):
+                val = _enable_bit(val, bit)
+        return val
+
+    def _encode(self, val: int) -> int:
+        register = 0
+        for bit, pin in enumerate(self._pins):
+            if _get_bit(val, bit):
+                register = _enable_bit(register, pin)
+        return register
+
+    @property
+    def value(self) -> int:
+        """Input levels of the group pins (single input register read)."""
+        return self._decode(self._pca.gpio)
+
+    @value.setter
+    def value(self, val: int) -> None:
+        self._pca.write_outputs(self.mask, self._encode(val))
+
+    def write(self, mask: int, val: int) -> None:
+        """Set the group pins selected by bit vector ``mask`` to the
+        corresponding bits of ``val``, leaving the other pins as they are."""
+        self._pca.write_outputs(self._encode(mask), self._encode(val))
+
+    @property
+    def output(self) -> int:
+        """Levels driven on the group pins, as last written."""
+        return self._decode(self._pca.output)
+
+    @property
+    def direction(self) -> Optional[Direction]:
+        """Direction of all pins of the group, or None if it is mixed."""
+        conf = self._pca.conf & self.mask
+        if conf == self.mask:
+            return digitalio.Direction.INPUT
+        if not conf:
+            return digitalio.Direction.OUTPUT
+        return None
+
+    @direction.setter
+    def direction(self, val: Direction) -> None:
+        self._set_conf(self.mask, val)
+
+    def set_direction(self, mask: int, val: Direction) -> None:
+        """Set the direction of the group pins selected by bit vector
+        ``mask``, leaving the other pins as they are."""
+        self._set_conf(self._encode(mask), val)
+
+    def _set_conf(self, register_mask: int, val: Direction) -> None:
+        conf = self._pca.conf
+        if val == digitalio.Direction.INPUT:
+            new_conf = conf | register_mask
+        elif val == digitalio.Direction.OUTPUT:
+            new_conf = conf & ~register_mask
+        else:
+            raise ValueError("Expected INPUT or OUTPUT direction!")
+        if new_conf != conf:
+            self._pca.conf = new_conf
+
+    def switch_to_output(self, value: int = 0) -> None:
+        """Switch all pins of the group to outputs driving ``value``."""
+        with self._pca.batch():
+            self.value = value
+            self.direction = digitalio.Direction.OUTPUT
+
+    def switch_to_input(self) -> None:
+        """Switch all pins of the group to inputs."""
+        self.direction = digitalio.Direction.INPUT
@@ -4,7 +4,7 @@
 # SPDX-License-Identifier: MIT
 
 import time
-from typing import List
+from typing import List, Optional
 
 from adafruit_bus_device import i2c_device
 from busio import I2C
@@ -13,14 +13,18 @@ from busio import I2C
 class EE24AA02XEXX:
     LENGTH = 1 << 8
     DEFAULT_PAGESIZE = 8
+    # time (in seconds) allowed for a page write cycle (5 ms at most, per
+    # datasheet), polled over the bus
+    WRITE_TIMEOUT = 0.05
 
     def __init__(
         self,
         bus_device: I2C,
         address: int,
         page_size: int = DEFAULT_PAGESIZE,
+        probe: bool = True,
     ) -> None:
-        self._device = i2c_device.I2CDevice(bus_device, address)
+        self._device = i2c_device.I2CDevice(bus_device, address, probe=probe)
         self.page_size = page_size
 
     @property
@@ -41,24 +45,33 @@ class EE24AA02XEXX:
 
     @property
     def contents(self) -> List[int]:
-        read_buffer = bytearray(self.LENGTH)
-        write_buffer = bytearray([0x0])
+        return [int(x) for x in self.read()]
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> bytes:
+        """Read ``length`` bytes (up to the end of the memory by default)
+        starting at ``offset``; a read past the end rolls over to address 0,
+        as the EEPROM address counter does."""
+        if length is None:
+            length = self.LENGTH - offset
+        if not (0 <= offset < self.LENGTH and 0 <= length <= self.LENGTH):
+            raise ValueError("Read out of EEPROM range.")
+        read_buffer = bytearray(length)
+        write_buffer = bytearray([offset])
         with self._device as i2c:
             i2c.write_then_readinto(write_buffer, read_buffer)
-        return [int(x) for x in read_buffer]
+        return bytes(read_buffer)
 
-    def _poll(self, timeout=None):
-        t = time.monotonic()
+    def _poll(self, i2c, timeout: float) -> None:
+        # the EEPROM NACKs its address until the write cycle is finished;
+        # i2c is the already locked device
+        deadline = time.monotonic() + timeout
         while True:
-            with self._device as i2c:
-                try:
-                    i2c.__probe_for_device()
-                    return
-                except OSError:
-                    pass
-            if timeout:
-                if t + timeout > time.monotonic():
-                    raise TimeoutError
+            try:
+                i2c.write(b"")
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("EEPROM write cycle did not finish in time.")
 
     @contents.setter
     def contents(self, value: List[int]) -> None:
@@ -66,7 +79,7 @@ class EE24AA02XEXX:
             for i in range(0, len(value), self.page_size):
                 write_buffer = bytearray([i, *(value[i : i + self.page_size])])
                 i2c.write(write_buffer)
-                self._poll()
+                self._poll(i2c, self.WRITE_TIMEOUT)
 
 
 class EEPROM24AA025E48(EE24AA02XEXX):
@@ -74,9 +87,15 @@ class EEPROM24AA025E48(EE24AA02XEXX):
     DEFAULT_PAGESIZE = 16
 
     def __init__(
-        self, bus_device: I2C, address: int, page_size: int = DEFAULT_PAGESIZE
+        self,
+        bus_device: I2C,
+        address: int,
+        page_size: int = DEFAULT_PAGESIZE,
+        probe: bool = True,
     ) -> None:
-        super().__init__(bus_device=bus_device, address=address, page_size=page_size)
+        super().__init__(
+            bus_device=bus_device, address=address, page_size=page_size, probe=probe
+        )
 
     @property
     def eui64(self) -> List[int]:
@@ -90,9 +109,15 @@ class EEPROM24AA02E48(EE24AA02XEXX):
     DEFAULT_PAGESIZE = 8
 
     def __init__(
-        self, bus_device: I2C, address: int, page_size: int = DEFAULT_PAGESIZE
+        self,
+        bus_device: I2C,
+        address: int,
+        page_size: int = DEFAULT_PAGESIZE,
+        probe: bool = True,
     ) -> None:
-        super().__init__(bus_device=bus_device, address=address, page_size=page_size)
+        super().__init__(
+            bus_device=bus_device, address=address, page_size=page_size, probe=probe
+        )
 
     @property
     def eui64(self) -> List[int]:
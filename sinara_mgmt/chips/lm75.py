@@ -2,12 +2,16 @@
 #
 # SPDX-License-Identifier: MIT
 
+from collections import namedtuple
+
 import adafruit_bus_device.i2c_device as i2cdevice
 from adafruit_register.i2c_bit import RWBit
 from adafruit_register.i2c_bits import ROBits, RWBits
 from adafruit_register.i2c_struct import ROUnaryStruct, UnaryStruct
 from busio import I2C
 
+from sinara_mgmt.chips.tca9548a import hold_channel
+
 LM75_DEFAULT_ADDRESS = 0x48
 LM75_REGISTER_TEMP = 0x00
 LM75_REGISTER_CONFIG = 0x01
@@ -15,6 +19,26 @@ LM75_REGISTER_THYST = 0x02
 LM75_REGISTER_TOS = 0x03
 LM75_REGISTER_PRODID = 0x07
 
+# (register, start, end) of registers within the snapshot buffer
+_SNAPSHOT_LAYOUT = (
+    (LM75_REGISTER_TEMP, 0, 2),
+    (LM75_REGISTER_CONFIG, 2, 3),
+    (LM75_REGISTER_THYST, 3, 5),
+    (LM75_REGISTER_TOS, 5, 7),
+)
+
+LM75State = namedtuple(
+    "LM75State",
+    ("temperature", "config", "temperature_hysteresis", "temperature_shutdown"),
+)
+
+
+def _decode_temperature(buffer: bytearray, start: int = 0) -> float:
+    raw = (buffer[start] << 8) | buffer[start + 1]
+    if raw & 0x8000:
+        raw -= 0x10000
+    return (raw >> 7) * 0.5
+
 
 class LM75:
     _temperature = ROUnaryStruct(LM75_REGISTER_TEMP, ">h")
@@ -30,10 +54,35 @@ class LM75:
         self, i2c_bus: I2C, device_address: int = LM75_DEFAULT_ADDRESS
     ) -> None:
         self.i2c_device = i2cdevice.I2CDevice(i2c_bus, device_address)
+        self._pointer = bytearray(1)
+        self._buffer = bytearray(7)
 
     @property
     def temperature(self) -> float:
-        return (self._temperature >> 7) * 0.5
+        # fast path: preallocated buffers, single write-then-read
+        with self.i2c_device as i2c:
+            self._pointer[0] = LM75_REGISTER_TEMP
+            i2c.write_then_readinto(self._pointer, self._buffer, in_end=2)
+        return _decode_temperature(self._buffer)
+
+    def snapshot(self) -> LM75State:
+        """Read temperature, configuration and both thresholds at once.
+
+        LM75 has no register auto-increment, so every register still needs
+        its own pointer write, but all reads share one bus lock and one
+        multiplexer channel selection and are decoded from a single buffer.
+        """
+        buf = self._buffer
+        with hold_channel(self.i2c_device.i2c), self.i2c_device as i2c:
+            for register, start, end in _SNAPSHOT_LAYOUT:
+                self._pointer[0] = register
+                i2c.write_then_readinto(self._pointer, buf, in_start=start, in_end=end)
+        return LM75State(
+            temperature=_decode_temperature(buf, 0),
+            config=buf[2],
+            temperature_hysteresis=_decode_temperature(buf, 3),
+            temperature_shutdown=_decode_temperature(buf, 5),
+        )
 
     @property
     def temperature_hysteresis(self) -> float:
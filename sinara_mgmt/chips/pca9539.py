@@ -8,9 +8,17 @@
 
 CircuitPython module for the PCA9539 I2C I/O extenders.
 
+Output, polarity inversion and configuration registers are only ever changed
+by the host, so the driver keeps shadow copies of them and every write is a
+single bus transaction (no read-modify-write). Use ``refresh()`` to resync
+the shadows with the device if it could have been reset or reprogrammed
+behind the driver's back, and ``batch()`` to coalesce several writes.
+
 * Author(s): Jakub Matyas
 """
 
+from contextlib import contextmanager
+from typing import Iterable
 
 try:
     from busio import I2C
@@ -19,7 +27,7 @@ except ImportError:
 
 from micropython import const
 
-from .digital_inout import DigitalInOut
+from .digital_inout import DigitalInOut, PinGroup
 from .pca9539_base import PCA9539Base
 
 _PCA9539_ADDRESS = const(0x74)
@@ -32,6 +40,9 @@ _PCA9539_POLINV1 = const(0x05)
 _PCA9539_CONF0 = const(0x06)
 _PCA9539_CONF1 = const(0x07)
 
+# order matters when writing back a batch: outputs before directions
+_SHADOWED_REGISTERS = (_PCA9539_POLINV0, _PCA9539_OPORT0, _PCA9539_CONF0)
+
 
 class PCA9539(PCA9539Base):
     """Supports PCA9539 instance on specified I2C bus and optionally
@@ -42,11 +53,69 @@ class PCA9539(PCA9539Base):
         self, i2c: I2C, address: int = _PCA9539_ADDRESS, reset: bool = True
     ) -> None:
         super().__init__(bus_device=i2c, address=address)
+        self._shadow = {}
+        self._dirty = set()
+        self._batch_depth = 0
         if reset:
             # Reset to all inputs with no pull-ups and no inverted polarity.
             self.conf = 0xFFFF
             self.polinv = 0x0000
-            self._write_u16le(_PCA9539_POLINV0, 0x0000)
+            self.output = 0xFFFF
+        else:
+            self.refresh()
+
+    def refresh(self) -> None:
+        """Read output, polarity inversion and configuration registers
+        back from the device into the shadow registers.
+        """
+        for register in _SHADOWED_REGISTERS:
+            self._shadow[register] = self._read_u16le(register)
+        self._dirty.clear()
+
+    @contextmanager
+    def batch(self):
+        """Context manager deferring register writes until the outermost
+        block exits; every modified register is then written exactly once
+        (output before configuration, so pins switched to outputs come up
+        at their new level).
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
+    def flush(self) -> None:
+        """Write back registers modified inside a ``batch()`` block."""
+        for register in _SHADOWED_REGISTERS:
+            if register in self._dirty:
+                self._write_u16le(register, self._shadow[register])
+                self._dirty.discard(register)
+
+    # Outside of a batch the shadow is only updated once the write succeeded,
+    # so a failed write is not skipped as redundant when it is retried.
+
+    def _write_shadow(self, register: int, val: int) -> None:
+        if self._batch_depth:
+            self._dirty.add(register)
+        else:
+            self._write_u16le(register, val)
+        self._shadow[register] = val & 0xFFFF
+
+    def _write_shadow_u8(self, register: int, val: int) -> None:
+        base = register & ~1
+        shift = 8 * (register & 1)
+        if self._batch_depth:
+            self._dirty.add(base)
+        else:
+            self._write_u8(register, val)
+        shadow = self._shadow[base] & ~(0xFF << shift)
+        self._shadow[base] = shadow | ((val & 0xFF) << shift)
+
+    def _read_shadow_u8(self, register: int) -> int:
+        return (self._shadow[register & ~1] >> (8 * (register & 1))) & 0xFF
 
     @property
     def gpio(self) -> int:
@@ -63,7 +132,24 @@ class PCA9539(PCA9539Base):
         the pin has been configured as an output. Otherwise, bit values have no
         effect on pins defined as inputs.
         """
-        self._write_u16le(_PCA9539_OPORT0, val)
+        self.output = val
+
+    @property
+    def output(self) -> int:
+        """The GPIO output register, as last written (shadow copy).  Each bit
+        represents the value driven on the associated output pin.
+        """
+        return self._shadow[_PCA9539_OPORT0]
+
+    @output.setter
+    def output(self, val: int) -> None:
+        self._write_shadow(_PCA9539_OPORT0, val)
+
+    def write_outputs(self, mask: int, val: int) -> None:
+        """Set output pins selected by ``mask`` to the corresponding bits of
+        ``val`` with a single output register write.
+        """
+        self.output = (self.output & ~mask) | (val & mask)
 
     @property
     def gpio0(self) -> int:
@@ -75,7 +161,7 @@ class PCA9539(PCA9539Base):
 
     @gpio0.setter
     def gpio0(self, val: int) -> None:
-        self._write_u8(_PCA9539_OPORT0, val)
+        self._write_shadow_u8(_PCA9539_OPORT0, val)
 
     @property
     def gpio1(self) -> int:
@@ -87,40 +173,40 @@ class PCA9539(PCA9539Base):
 
     @gpio1.setter
     def gpio1(self, val: int) -> None:
-        self._write_u8(_PCA9539_OPORT1, val)
+        self._write_shadow_u8(_PCA9539_OPORT1, val)
 
     @property
     def conf(self) -> int:
-        """The raw CONFIGURATION direction register.  Each bit represents
+        """The (shadowed) CONFIGURATION direction register.  Each bit represents
         direction of a pin, either 1 for an input or 0 for an output mode.
         """
-        return self._read_u16le(_PCA9539_CONF0)
+        return self._shadow[_PCA9539_CONF0]
 
     @conf.setter
     def conf(self, val: int) -> None:
-        self._write_u16le(_PCA9539_CONF0, val)
+        self._write_shadow(_PCA9539_CONF0, val)
 
     @property
     def conf0(self) -> int:
-        """The raw CONFIGURATION 0 direction register.  Each bit represents
+        """The (shadowed) CONFIGURATION 0 direction register.  Each bit represents
         direction of a pin, either 1 for an input or 0 for an output mode.
         """
-        return self._read_u8(_PCA9539_CONF0)
+        return self._read_shadow_u8(_PCA9539_CONF0)
 
     @conf0.setter
     def conf0(self, val: int) -> None:
-        self._write_u8(_PCA9539_CONF0, val)
+        self._write_shadow_u8(_PCA9539_CONF0, val)
 
     @property
     def conf1(self) -> int:
-        """The raw CONFIGURATION 1 direction register.  Each bit represents
+        """The (shadowed) CONFIGURATION 1 direction register.  Each bit represents
         direction of a pin, either 1 for an input or 0 for an output mode.
         """
-        return self._read_u8(_PCA9539_CONF1)
+        return self._read_shadow_u8(_PCA9539_CONF1)
 
     @conf1.setter
     def conf1(self, val: int) -> None:
-        self._write_u8(_PCA9539_CONF1, val)
+        self._write_shadow_u8(_PCA9539_CONF1, val)
 
     def get_pin(self, pin: int) -> DigitalInOut:
         """Convenience function to create an instance of the DigitalInOut class
@@ -130,35 +216,45 @@ class PCA9539(PCA9539Base):
             raise ValueError("Pin number must be 0-15.")
         return DigitalInOut(pin, self)
 
+    def get_pins(self, pins: Iterable[int]) -> PinGroup:
+        """Convenience function to create an instance of the PinGroup class
+        pointing at the specified pins of this PCA9539 device, so they can be
+        read and written together as a bit vector.
+        """
+        pins = tuple(pins)
+        if not all(0 <= pin <= 15 for pin in pins):
+            raise ValueError("Pin numbers must be 0-15.")
+        return PinGroup(pins, self)
+
     @property
     def polinv(self) -> int:
-        """The raw POLARITY INVERSION register.  Each bit represents the
+        """The (shadowed) POLARITY INVERSION register.  Each bit represents the
         polarity value of the associated input pin (0 = normal, 1 = inverted).
         """
-        return self._read_u16le(_PCA9539_POLINV0)
+        return self._shadow[_PCA9539_POLINV0]
 
     @polinv.setter
     def polinv(self, val: int) -> None:
-        self._write_u16le(_PCA9539_POLINV0, val)
+        self._write_shadow(_PCA9539_POLINV0, val)
 
     @property
     def polinv0(self) -> int:
-        """The raw POLARITY INVERSION 0 register.  Each bit represents the
+        """The (shadowed) POLARITY INVERSION 0 register.  Each bit represents the
         polarity value of the associated input pin (0 = normal, 1 = inverted).
         """
-        return self._read_u8(_PCA9539_POLINV0)
+        return self._read_shadow_u8(_PCA9539_POLINV0)
 
     @polinv0.setter
     def polinv0(self, val: int) -> None:
-        self._write_u8(_PCA9539_POLINV0, val)
+        self._write_shadow_u8(_PCA9539_POLINV0, val)
 
     @property
     def polinv1(self) -> int:
-        """The raw POLARITY INVERSION 1 register.  Each bit represents the
+        """The (shadowed) POLARITY INVERSION 1 register.  Each bit represents the
         polarity value of the associated input pin (0 = normal, 1 = inverted).
         """
-        return self._read_u8(_PCA9539_POLINV1)
+        return self._read_shadow_u8(_PCA9539_POLINV1)
 
     @polinv1.setter
     def polinv1(self, val: int) -> None:
-        self._write_u8(_PCA9539_POLINV1, val)
+        self._write_shadow_u8(_PCA9539_POLINV1, val)
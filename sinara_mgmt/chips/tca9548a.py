@@ -31,6 +31,7 @@ Implementation Notes
 """
 
 import time
+from contextlib import contextmanager, nullcontext
 
 from micropython import const
 
@@ -60,13 +61,54 @@ class TCA9548A_Channel:
 
     def _channel_op(func):
         def wrapper(self, *args, **kwargs):
-            self.tca.i2c.writeto(self.tca.address, self.channel_switch)
-            ret = func(self, *args, **kwargs)
-            self.tca.i2c.writeto(self.tca.address, b"\x00")
-            return ret
+            # select, operation and release under one bus lock, so they are
+            # not interleaved with operations of other threads
+            self.try_lock()
+            try:
+                held = self.tca.held
+                if held is self:
+                    # channel kept selected by selected() - no switching needed
+                    return func(self, *args, **kwargs)
+                self.tca.i2c.writeto(self.tca.address, self.channel_switch)
+                self.tca.selection = self
+                ret = func(self, *args, **kwargs)
+                self.tca.i2c.writeto(
+                    self.tca.address, held.channel_switch if held else b"\x00"
+                )
+                self.tca.selection = held
+                return ret
+            finally:
+                self.unlock()
 
         return wrapper
 
+    @contextmanager
+    def selected(self):
+        """Keep the channel selected for the duration of the block, so that
+        operations inside it skip the per-operation select/release writes.
+
+        The bus lock is held for the whole block (the bus must be reentrant,
+        as KasliI2C is), so the selection and every operation inside it are
+        exclusive to the calling thread.
+        """
+        self.try_lock()
+        try:
+            if self.tca.held is self:
+                yield self
+                return
+            if self.tca.held is not None:
+                raise RuntimeError("Another channel of this multiplexer is held.")
+            self.tca.i2c.writeto(self.tca.address, self.channel_switch)
+            self.tca.held = self.tca.selection = self
+            try:
+                yield self
+            finally:
+                self.tca.held = None
+                self.tca.i2c.writeto(self.tca.address, b"\x00")
+                self.tca.selection = None
+        finally:
+            self.unlock()
+
     def try_lock(self) -> bool:
         """Pass through for try_lock."""
         while not self.tca.i2c.try_lock():
@@ -129,7 +171,15 @@ class TCA9548A_Channel:
                 raise ValueError("No I2C device at address: 0x%x" % device_address)
                 # pylint: enable=raise-missing-from
         finally:
-            self.i2c.unlock()
+            self.unlock()
+
+
+def hold_channel(bus):
+    """Context manager keeping ``bus`` selected if it is a multiplexer channel;
+    does nothing for any other bus."""
+    if isinstance(bus, TCA9548A_Channel):
+        return bus.selected()
+    return nullcontext(bus)
 
 
 class TCA9548A:
@@ -139,6 +189,10 @@ class TCA9548A:
         self.i2c = i2c
         self.address = address
         self.channels = [None] * 8
+        self.held = None
+        # channel currently selected (by selected() or an operation in
+        # progress), for restoring the selection after a mux reset
+        self.selection = None
 
     def __len__(self) -> Literal[8]:
         return 8
@@ -158,6 +212,8 @@ class PCA9546A:
         self.i2c = i2c
         self.address = address
         self.channels = [None] * 4
+        self.held = None
+        self.selection = None
 
     def __len__(self) -> Literal[4]:
         return 4
@@ -0,0 +1,253 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`cli`
+====================================================
+
+Command-line interface, run as ``python -m sinara_mgmt <command>``.
+
+Hardware support (Blinka, pyftdi and the chip drivers) is only imported by
+commands that access a crate, so offline commands such as ``describe`` from
+EEPROM dumps start quickly.
+
+* Author(s): Jakub Matyas
+"""
+
+import argparse
+import json
+from typing import List, Optional
+
+from sinara_mgmt.sinara import Sinara
+
+DEFAULT_URL = "ftdi://ftdi:4232:/2"
+
+
+def _open_kasli(args):
+    if args.diot:
+        from sinara_mgmt.kasli_diot import KasliDIOT
+
+        return KasliDIOT(url=args.url, frequency=args.frequency)
+
+    from sinara_mgmt.kasli import KasliI2C
+
+    return KasliI2C(url=args.url, frequency=args.frequency)
+
+
+def _discover(kasli, diot: bool) -> list:
+    kasli.discover_peripherals()
+    if diot:
+        from sinara_mgmt.kasli_diot import unwrap_from_diot
+
+        return unwrap_from_diot(p for p in kasli.diot_peripherals if p is not None)
+    return kasli.eem_peripherals
+
+
+def _format_sinara(dev: Sinara) -> str:
+    return f"{dev.name_fmt} ({dev.vendor_fmt}, EUI-48 {dev.eui48_fmt})"
+
+
+def _eeprom(kasli, eem: Optional[int]):
+    if eem is None:
+        return kasli.eeprom
+
+    from sinara_mgmt.chips.eeprom_24aa025e48 import EEPROM24AA02E48
+
+    return EEPROM24AA02E48(kasli.bus_eem[eem], address=0x50)
+
+
+def cmd_discover(args) -> None:
+    kasli = _open_kasli(args)
+    controller = None
+    try:
+        controller = kasli.sinara_eeprom
+        print(f"Kasli: {_format_sinara(controller)}")
+    except ValueError as e:
+        print(f"Kasli: no valid Sinara EEPROM ({e})")
+    peripherals = _discover(kasli, args.diot)
+    for dev, ports in peripherals:
+        print(f"EEM {ports}: {_format_sinara(dev)}")
+
+    if args.inventory is not None:
+        if controller is None:
+            raise SystemExit("Crate without a valid Kasli EEPROM not recorded")
+        from sinara_mgmt.inventory import Inventory
+
+        with Inventory(args.inventory) as inventory:
+            moves = inventory.record(controller.eui48_fmt, peripherals, controller)
+        for move in moves:
+            print(
+                f"Moved {move.eui48}: crate {move.from_crate} slot {move.from_slot}"
+                f" -> crate {move.to_crate} slot {move.to_slot}"
+            )
+
+
+def cmd_eeprom_dump(args) -> None:
+    contents = bytes(_eeprom(_open_kasli(args), args.eem).contents)
+    if args.output is not None:
+        with open(args.output, "wb") as f:
+            f.write(contents)
+        return
+    try:
+        dev = Sinara.unpack(contents)
+    except ValueError as e:
+        print(f"Not a valid Sinara EEPROM ({e}):")
+        print(contents.hex())
+        return
+    for field, value in dev._asdict().items():
+        print(f"{field}: {value}")
+
+
+def cmd_eeprom_program(args) -> None:
+    with open(args.input, "rb") as f:
+        contents = f.read()
+    # refuse to program anything that would not be identified afterwards
+    Sinara.unpack(contents)
+    eeprom = _eeprom(_open_kasli(args), args.eem)
+    eeprom.contents = list(contents)
+    if bytes(eeprom.contents) != contents:
+        raise SystemExit("EEPROM verification failed")
+
+
+def _parse_eem_dump(arg: str):
+    ports, _, filename = arg.partition(":")
+    with open(filename, "rb") as f:
+        dev = Sinara.unpack(f.read())
+    return dev, [int(port) for port in ports.split(",")]
+
+
+def cmd_describe(args) -> None:
+    from sinara_mgmt.description_manager import SystemDescription
+
+    if args.controller is not None:
+        # offline, from EEPROM dumps
+        with open(args.controller, "rb") as f:
+            controller = Sinara.unpack(f.read())
+        devs = [_parse_eem_dump(arg) for arg in args.eem]
+    else:
+        kasli = _open_kasli(args)
+        controller = kasli.sinara_eeprom
+        devs = _discover(kasli, args.diot)
+
+    description = SystemDescription(controller, devs)
+    description.gen_system_description()
+    if args.output is not None:
+        description.dump_description(args.output)
+    else:
+        print(json.dumps(description.description, indent=4))
+
+
+def cmd_scan(args) -> None:
+    kasli = _open_kasli(args)
+    if args.bus == "shared":
+        bus = kasli.bus_shared
+    elif args.bus == "eem":
+        bus = kasli.bus_eem[args.index]
+    else:
+        bus = kasli.bus_sfp[args.index]
+    kasli.print_bus_addresses(bus, prefix="")
+
+
+def cmd_inventory(args) -> None:
+    from sinara_mgmt.inventory import Inventory
+
+    with Inventory(args.database) as inventory:
+        if args.eui48 is not None:
+            board = inventory.locate(args.eui48)
+            boards = [] if board is None else [board]
+        else:
+            boards = inventory.find(
+                board=args.board,
+                hw_rev=args.hw_rev,
+                crate=args.crate,
+                present=None if args.all else True,
+            )
+        for board in boards:
+            variant = f"-{board.variant}" if board.variant else ""
+            location = f"crate {board.crate} slot {board.slot}"
+            if not board.present:
+                location = f"last seen in {location}"
+            print(f"{board.eui48}: {board.board}{variant}/{board.hw_rev}, {location}")
+        if args.eui48 is not None:
+            for move in inventory.moves(args.eui48):
+                print(
+                    f"  moved from crate {move.from_crate} slot {move.from_slot}"
+                    f" to crate {move.to_crate} slot {move.to_slot}"
+                )
+
+
+def _add_kasli_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--url", default=DEFAULT_URL, help="FTDI URL of Kasli")
+    parser.add_argument("--frequency", type=int, default=100000)
+    parser.add_argument("--diot", action="store_true", help="Kasli with DIOT")
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="sinara-mgmt", description="Sinara management tools"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    discover = commands.add_parser("discover", help="discover EEM peripherals")
+    _add_kasli_args(discover)
+    discover.add_argument(
+        "--inventory", metavar="DB", help="record results in an inventory database"
+    )
+    discover.set_defaults(func=cmd_discover)
+
+    eeprom = commands.add_parser("eeprom", help="dump or program EEPROMs")
+    eeprom_commands = eeprom.add_subparsers(dest="eeprom_command", required=True)
+    dump = eeprom_commands.add_parser("dump", help="read EEPROM contents")
+    _add_kasli_args(dump)
+    dump.add_argument("--eem", type=int, help="EEM port (Kasli's EEPROM if omitted)")
+    dump.add_argument("-o", "--output", help="write raw contents to a file")
+    dump.set_defaults(func=cmd_eeprom_dump)
+    program = eeprom_commands.add_parser("program", help="write EEPROM contents")
+    _add_kasli_args(program)
+    program.add_argument("--eem", type=int, help="EEM port (Kasli's EEPROM if omitted)")
+    program.add_argument("input", help="file with raw (packed) contents")
+    program.set_defaults(func=cmd_eeprom_program)
+
+    describe = commands.add_parser("describe", help="generate system description JSON")
+    _add_kasli_args(describe)
+    describe.add_argument(
+        "--controller", help="Kasli EEPROM dump (describe offline, from dumps)"
+    )
+    describe.add_argument(
+        "--eem",
+        action="append",
+        default=[],
+        metavar="PORTS:FILE",
+        help="EEPROM dump of a peripheral on comma-separated EEM ports",
+    )
+    describe.add_argument("-o", "--output", help="output file name (without .json)")
+    describe.set_defaults(func=cmd_describe)
+
+    scan = commands.add_parser("scan", help="scan an I2C bus")
+    _add_kasli_args(scan)
+    scan.add_argument("bus", choices=("shared", "eem", "sfp"))
+    scan.add_argument("index", type=int, nargs="?", default=0)
+    scan.set_defaults(func=cmd_scan)
+
+    inventory = commands.add_parser("inventory", help="query an inventory database")
+    inventory.add_argument("database")
+    inventory.add_argument("--eui48", help="locate the board with this EUI-48")
+    inventory.add_argument("--board", help="board type, e.g. Urukul")
+    inventory.add_argument("--hw-rev", help="hardware revision, e.g. v1.5")
+    inventory.add_argument("--crate", help="EUI-48 of the crate's Kasli")
+    inventory.add_argument(
+        "--all", action="store_true", help="include boards no longer present"
+    )
+    inventory.set_defaults(func=cmd_inventory)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = make_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
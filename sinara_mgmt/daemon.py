@@ -0,0 +1,449 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`daemon`
+====================================================
+
+Long-running crate management daemon.
+
+The daemon owns ``KasliI2C`` / ``KasliDIOT`` instances for the lifetime of the
+process and keeps discovery results, EEPROM contents and sensor readings in
+a cache. Queries are served from the cache over a local Unix socket (one JSON
+object per line in both directions; in ``$XDG_RUNTIME_DIR`` by default and
+accessible to the owner only), and entries are refreshed in the
+background by a ``PollScheduler`` per crate, spending at most ``budget`` of
+the time on the bus of the crate. Refreshes requested by clients go through
+the same scheduler, ahead of background polling. DIOT slots are tracked by
+a ``DiotHotplugWatcher``: a refresh reads the presence bitmap and only
+identifies boards in slots that changed.
+
+Run with ``python -m sinara_mgmt.daemon --crate kasli=ftdi://ftdi:4232:/2``.
+
+Requests are ``{"crate": <name>, "key": <key>}``, optionally with
+``"max_age": <seconds>`` to force a refresh of older entries, or
+``{"crate": <name>}`` / ``{}`` to list keys and crates, or
+``{"crate": <name>, "stats": true}`` for polling statistics (runs, deadline
+misses, latencies) of its keys. Responses are
+``{"value": ..., "timestamp": ..., "age": ...}`` or ``{"error": ...}``.
+
+* Author(s): Jakub Matyas
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+from typing import Dict, List, Optional
+
+from sinara_mgmt.diot_hotplug import DiotHotplugWatcher
+from sinara_mgmt.scheduler import PollScheduler, PollTask
+from sinara_mgmt.sinara import Sinara
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir()), "sinara-mgmt.sock"
+)
+
+# value is None and error is set if the last refresh failed
+CachedValue = namedtuple("CachedValue", ("value", "timestamp", "error"))
+
+# estimated bus transactions of a refresh of each key, including the
+# multiplexer select and release around every access on a channel
+_COSTS = {
+    "eui48": 3,
+    "sinara_eeprom": 3,
+    "sfp": 12,
+    "eem_peripherals": 54,
+    # presence poll of DIOT slots - only slots whose presence changed are
+    # identified, and that (rare) extra bus time is charged as it is spent
+    "diot_peripherals": 3,
+}
+# multiplexer select and release around a group run on a held channel
+_HOLD_COST = 2
+# polling priorities - link status first, inventory last
+_PRIORITIES = {"sfp": 2, "temperatures": 1, "diot_peripherals": 1}
+
+
+def sinara_to_json(dev: Optional[Sinara]) -> Optional[dict]:
+    if dev is None:
+        return None
+    return {
+        "name": dev.name,
+        "board": dev.board_fmt,
+        "variant": dev.variant_fmt,
+        "hw_rev": dev.hw_rev,
+        "vendor": dev.vendor_fmt,
+        "port": dev.port,
+        "eui48": dev.eui48_fmt,
+    }
+
+
+class CrateCache:
+    """Cached state of a single crate (``KasliI2C`` or ``KasliDIOT``).
+
+    Every key has a refresh function and a refresh period in seconds. The
+    bus is only accessed under ``lock`` (the bus lock of the Kasli);
+    ``bus_time`` accumulates the time spent refreshing. With ``scheduler``
+    set and running, refreshes of ``get()`` are submitted to it.
+    """
+
+    def __init__(
+        self,
+        kasli,
+        sensors: Optional[dict] = None,
+        periods: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.kasli = kasli
+        self.sensors = sensors or {}
+        self.lock = kasli.bus_lock
+        self.bus_time = 0.0
+
+        self._refreshers = {
+            "eui48": (self._eui48, 3600.0),
+            "sinara_eeprom": (self._sinara_eeprom, 3600.0),
+            "sfp": (self._sfp, 1.0),
+        }
+        self.watcher = None
+        if hasattr(kasli, "diot_peripherals"):
+            # DIOT slots are tracked incrementally rather than rediscovered
+            self.watcher = DiotHotplugWatcher(kasli)
+            self._refreshers["diot_peripherals"] = (self._diot_peripherals, 5.0)
+        else:
+            self._refreshers["eem_peripherals"] = (self._eem_peripherals, 60.0)
+        if self.sensors:
+            self._refreshers["temperatures"] = (self._temperatures, 1.0)
+        for key, period in (periods or {}).items():
+            self._refreshers[key] = (self._refreshers[key][0], period)
+
+        self._cache = {}
+        self.scheduler = None
+
+    @property
+    def keys(self) -> List[str]:
+        return list(self._refreshers)
+
+    def cost(self, key: str) -> int:
+        if key == "temperatures":
+            # sensors are read one by one, with the channel held selected
+            return len(self.sensors) + _HOLD_COST
+        return _COSTS.get(key, 1)
+
+    def _sensor_channel(self):
+        buses = {
+            id(sensor.i2c_device.i2c): sensor.i2c_device.i2c
+            for sensor in self.sensors.values()
+        }
+        return next(iter(buses.values())) if len(buses) == 1 else None
+
+    def poll_tasks(self) -> List[PollTask]:
+        """Tasks refreshing every key with its period."""
+        return [
+            PollTask(
+                key,
+                partial(self.refresh, key),
+                period,
+                priority=_PRIORITIES.get(key, 0),
+                cost=self.cost(key),
+                channel=self._sensor_channel() if key == "temperatures" else None,
+            )
+            for key, (_, period) in self._refreshers.items()
+        ]
+
+    def get(self, key: str, max_age: Optional[float] = None) -> CachedValue:
+        """Cached value of ``key``; it is refreshed first if it has not been
+        read yet or is older than ``max_age``.
+        """
+        cached = self._cache.get(key)
+        if cached is None or (
+            max_age is not None and time.time() - cached.timestamp > max_age
+        ):
+            if key not in self._refreshers:
+                raise KeyError(f"Unknown key: {key}")
+            if self.scheduler is not None and self.scheduler.running:
+                future = self.scheduler.submit(
+                    partial(self.refresh, key), cost=self.cost(key), name=key
+                )
+                cached = future.result()
+            else:
+                cached = self.refresh(key)
+        return cached
+
+    def refresh(self, key: str) -> CachedValue:
+        try:
+            refresher = self._refreshers[key][0]
+        except KeyError:
+            raise KeyError(f"Unknown key: {key}")
+        with self.lock:
+            start = time.monotonic()
+            try:
+                cached = CachedValue(refresher(), time.time(), None)
+            except (OSError, ValueError, IndexError) as e:
+                # IndexError - board or vendor ID unknown to Sinara
+                logger.warning("Failed to refresh %s: %s", key, e)
+                cached = CachedValue(None, time.time(), str(e))
+            finally:
+                self.bus_time += time.monotonic() - start
+        self._cache[key] = cached
+        return cached
+
+    def _eui48(self) -> List[int]:
+        return self.kasli.eeprom.eui48
+
+    def _sinara_eeprom(self) -> Optional[dict]:
+        return sinara_to_json(self.kasli.sinara_eeprom)
+
+    def _eem_peripherals(self) -> List[dict]:
+        self.kasli.discover_peripherals()
+        return [
+            dict(sinara_to_json(dev), slot=slot)
+            for dev, slot in self.kasli.eem_peripherals
+        ]
+
+    def _diot_peripherals(self) -> List[Optional[dict]]:
+        self.watcher.poll()
+        peripherals = []
+        for peripheral in self.kasli.diot_peripherals:
+            if peripheral is None:
+                peripherals.append(None)
+                continue
+            edapter, ports = peripheral
+            peripherals.append(
+                {"device": sinara_to_json(edapter.device), "ports": ports}
+            )
+        return peripherals
+
+    def _sfp(self) -> List[dict]:
+        return [getattr(self.kasli, f"sfpio{sfp}").status._asdict() for sfp in range(4)]
+
+    def _temperatures(self) -> Dict[str, float]:
+        return {name: sensor.temperature for name, sensor in self.sensors.items()}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                response = self.server.management_daemon.handle_request(
+                    json.loads(line)
+                )
+            except Exception as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ManagementDaemon:
+    """Serve cached state of ``crates`` over a Unix socket at ``path`` and
+    refresh it in the background, spending at most ``budget`` of the time
+    (averaged over ``period`` seconds) on the bus of each crate.
+    """
+
+    def __init__(
+        self,
+        crates: Dict[str, CrateCache],
+        path: str = DEFAULT_SOCKET,
+        period: float = 1.0,
+        budget: float = 0.1,
+    ) -> None:
+        self.crates = crates
+        self.path = path
+        self.period = period
+        self.budget = budget
+
+        self._server = None
+        self._threads = []
+
+    def handle_request(self, request: dict) -> dict:
+        name = request.get("crate")
+        if name is None:
+            return {"crates": list(self.crates)}
+        try:
+            crate = self.crates[name]
+        except KeyError:
+            return {"error": f"Unknown crate: {name}"}
+        if request.get("stats"):
+            if crate.scheduler is None:
+                return {"error": "Crate is not polled"}
+            return {
+                "stats": {
+                    name: stats._asdict()
+                    for name, stats in crate.scheduler.stats().items()
+                }
+            }
+        key = request.get("key")
+        if key is None:
+            return {"keys": crate.keys}
+        try:
+            cached = crate.get(key, request.get("max_age"))
+        except KeyError as e:
+            return {"error": e.args[0]}
+        response = {
+            "value": cached.value,
+            "timestamp": cached.timestamp,
+            "age": time.time() - cached.timestamp,
+        }
+        if cached.error is not None:
+            response["error"] = cached.error
+        return response
+
+    def start(self) -> None:
+        if self._server is not None:
+            raise RuntimeError("Daemon already running")
+        self._remove_stale_socket()
+        # socket accessible to the owner only from the moment it is bound
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.path, _RequestHandler)
+        finally:
+            os.umask(umask)
+        self._server.management_daemon = self
+        # crates are on independent buses - poll them in parallel
+        for crate in self.crates.values():
+            crate.scheduler = PollScheduler(crate.lock, self.budget, window=self.period)
+            for task in crate.poll_tasks():
+                crate.scheduler.add(task)
+            crate.scheduler.start()
+        self._threads = [
+            threading.Thread(
+                target=self._server.serve_forever, name="daemon-server", daemon=True
+            )
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _remove_stale_socket(self) -> None:
+        try:
+            mode = os.stat(self.path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise FileExistsError(f"{self.path} exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.path)
+            except ConnectionRefusedError:
+                # left behind by a daemon that did not shut down cleanly
+                os.unlink(self.path)
+                return
+        raise RuntimeError(f"Another daemon is serving on {self.path}")
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        for crate in self.crates.values():
+            crate.scheduler.stop()
+            crate.scheduler = None
+        self._threads = []
+        self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __enter__(self) -> "ManagementDaemon":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+
+class DaemonClient:
+    """Connection to a running ``ManagementDaemon``."""
+
+    def __init__(self, path: str = DEFAULT_SOCKET) -> None:
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._file = self._socket.makefile("rwb")
+
+    def query(self, crate: Optional[str] = None, key: Optional[str] = None, **kwargs):
+        request = dict(kwargs)
+        if crate is not None:
+            request["crate"] = crate
+        if key is not None:
+            request["key"] = key
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+        return json.loads(self._file.readline())
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self) -> "DaemonClient":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def _open_crate(url: str, diot: bool, frequency: int) -> CrateCache:
+    if diot:
+        from sinara_mgmt.kasli_diot import KasliDIOT
+        from sinara_mgmt.telemetry import find_lm75
+
+        kasli = KasliDIOT(url=url, frequency=frequency)
+        sensors = {
+            f"lm75_0x{sensor.i2c_device.device_address:02x}": sensor
+            for sensor in find_lm75(kasli.mon_i2c)
+        }
+        return CrateCache(kasli, sensors)
+
+    from sinara_mgmt.kasli import KasliI2C
+
+    return CrateCache(KasliI2C(url=url, frequency=frequency))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Sinara crate management daemon")
+    parser.add_argument(
+        "--crate",
+        action="append",
+        required=True,
+        metavar="NAME=URL",
+        help="crate name and FTDI URL (can be given multiple times)",
+    )
+    parser.add_argument("--diot", action="store_true", help="crates are Kasli DIOT")
+    parser.add_argument("--frequency", type=int, default=100000)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--period", type=float, default=1.0)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.1,
+        help="fraction of the time that can be spent on the bus of a crate",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    crates = {}
+    for crate in args.crate:
+        name, _, url = crate.partition("=")
+        crates[name] = _open_crate(url, args.diot, args.frequency)
+
+    with ManagementDaemon(crates, args.socket, args.period, args.budget):
+        logger.info("Serving %s on %s", ", ".join(crates), args.socket)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@
 import json
 from typing import List, Tuple
 
+from sinara_mgmt.profiling import profiled
 from sinara_mgmt.sinara import Sinara, _SinaraTuple
 
 SINARA_KEYS = _SinaraTuple._fields
@@ -89,6 +90,7 @@ class SystemDescription(DescGenerationManager):
             "sed_lanes": None,
         }
 
+    @profiled()
     def gen_system_description(self):
         if not self.peripherals:
             # no peripherals' description was generated
@@ -0,0 +1,145 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`diot_hotplug`
+====================================================
+
+Background watcher reporting peripherals inserted into and removed from
+Kasli DIOT slots.
+
+Every poll reads the servmod presence bitmap (a single expander GPIO read)
+and only slots whose bit changed are identified or cleared, updating
+``KasliDIOT.diot_peripherals`` in place. A bus error while identifying an
+inserted board is retried on the next poll (the board may still be
+seating); a board that cannot be identified (e.g. invalid EEPROM contents)
+is reported once with a ``FAILED`` event carrying the error.
+
+* Author(s): Jakub Matyas
+"""
+
+import logging
+import queue
+import threading
+from collections import namedtuple
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INSERTED = "inserted"
+REMOVED = "removed"
+FAILED = "failed"
+
+DiotSlotEvent = namedtuple("DiotSlotEvent", ("kind", "slot", "peripheral"))
+
+
+class DiotHotplugWatcher:
+    """Watch DIOT slots of ``kasli`` (a ``KasliDIOT``) for changes.
+
+    Events are put on the ``events`` queue and passed to every subscribed
+    callback. Slots already present in ``kasli.diot_peripherals`` (e.g. after
+    ``discover_peripherals()``) are treated as known; otherwise the first poll
+    reports every occupied slot as inserted.
+
+    The watcher holds ``lock`` (the Kasli's reentrant ``bus_lock``) while it
+    accesses the bus - code driving the same Kasli from other threads should
+    hold it as well.
+    """
+
+    def __init__(self, kasli, period: float = 1.0) -> None:
+        self.kasli = kasli
+        self.period = period
+        self.events = queue.Queue()
+        self.lock = kasli.bus_lock
+
+        self._callbacks = []
+        self._known = 0
+        for slot, peripheral in enumerate(kasli.diot_peripherals):
+            if peripheral is not None:
+                self._known |= 1 << slot
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def subscribe(self, callback: Callable[[DiotSlotEvent], None]) -> None:
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback: Callable[[DiotSlotEvent], None]) -> None:
+        self._callbacks.remove(callback)
+
+    def poll(self) -> List[DiotSlotEvent]:
+        """Read the presence bitmap once and handle changed slots."""
+        events = []
+        with self.lock:
+            occupied = self.kasli.probe_diot_slots()
+            changed = occupied ^ self._known
+            for slot in range(8):
+                if not changed & (1 << slot):
+                    continue
+                if occupied & (1 << slot):
+                    try:
+                        peripheral = self.kasli.discover_slot(slot)
+                    except OSError as e:
+                        # board may still be seating - retry on next poll
+                        logger.warning("Failed to identify DIOT slot %d: %s", slot, e)
+                        continue
+                    except ValueError as e:
+                        # not identifiable - not retried until reinserted
+                        logger.error("Cannot identify DIOT slot %d: %s", slot, e)
+                        self._known |= 1 << slot
+                        events.append(DiotSlotEvent(FAILED, slot, e))
+                        continue
+                    self._known |= 1 << slot
+                    events.append(DiotSlotEvent(INSERTED, slot, peripheral))
+                else:
+                    peripheral = self.kasli.drop_peripheral(slot)
+                    self._known &= ~(1 << slot)
+                    events.append(DiotSlotEvent(REMOVED, slot, peripheral))
+
+        for event in events:
+            self._publish(event)
+        return events
+
+    def _publish(self, event: DiotSlotEvent) -> None:
+        self.events.put(event)
+        for callback in list(self._callbacks):
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("DIOT hot-plug callback failed")
+
+    def start(self) -> None:
+        if self._thread is not None:
+            raise RuntimeError("Watcher already running")
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="diot-hotplug", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except OSError as e:
+                logger.warning("DIOT presence poll failed: %s", e)
+            self._stop_event.wait(self.period)
+
+    def __enter__(self) -> "DiotHotplugWatcher":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
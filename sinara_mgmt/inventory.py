@@ -0,0 +1,285 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`inventory`
+====================================================
+
+Fleet inventory of Sinara boards in an embedded SQLite database.
+
+Every board is identified by its EUI-48 and stored with its type, revision,
+variant, vendor, current location (EUI-48 of the crate's Kasli and EEM slot)
+and first/last seen timestamps. Discovery results of a crate are recorded
+with ``record()`` (or ``record_kasli()`` / ``record_description()``); a board
+found at a different location than before is recorded as a move, boards no
+longer found in the crate are marked absent (keeping their last location).
+
+Lookups by EUI-48 (the primary key of boards, and an index of moves), board
+type and revision or crate are indexed, so questions like "where is board X"
+do not need a hardware sweep. Board, variant and vendor IDs missing from the
+tables of ``Sinara`` (e.g. boards newer than this package) are stored as
+their raw numbers::
+
+    inventory = Inventory("fleet.sqlite")
+    inventory.record_kasli(kasli)
+    inventory.locate("54-10-ec-00-00-01")
+    inventory.crates("Urukul", "v1.5")
+
+* Author(s): Jakub Matyas
+"""
+
+import logging
+import sqlite3
+import time
+from collections import namedtuple
+from typing import Iterable, List, Optional, Tuple, Union
+
+from sinara_mgmt.sinara import Sinara
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+-- lookups of boards by EUI-48 use the primary key index
+CREATE TABLE IF NOT EXISTS boards (
+    eui48 TEXT PRIMARY KEY,
+    board TEXT NOT NULL,
+    hw_rev TEXT NOT NULL,
+    variant TEXT,
+    vendor TEXT,
+    crate TEXT,
+    slot INTEGER,
+    present INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS boards_board ON boards (board, hw_rev);
+CREATE INDEX IF NOT EXISTS boards_crate ON boards (crate, slot);
+CREATE TABLE IF NOT EXISTS moves (
+    eui48 TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    from_crate TEXT,
+    from_slot INTEGER,
+    to_crate TEXT,
+    to_slot INTEGER
+);
+CREATE INDEX IF NOT EXISTS moves_eui48 ON moves (eui48, timestamp);
+"""
+
+_BOARD_COLUMNS = (
+    "eui48",
+    "board",
+    "hw_rev",
+    "variant",
+    "vendor",
+    "crate",
+    "slot",
+    "present",
+    "first_seen",
+    "last_seen",
+)
+
+BoardRecord = namedtuple("BoardRecord", _BOARD_COLUMNS)
+Move = namedtuple(
+    "Move", ("eui48", "timestamp", "from_crate", "from_slot", "to_crate", "to_slot")
+)
+
+# EUI-48 of an EEPROM without one (erased or not a 24AA02E48)
+_NO_EUI48 = "ff-ff-ff-ff-ff-ff"
+
+
+def _field(dev: Sinara, name: str) -> Optional[str]:
+    # formatted ID, or the raw one if it is not in the tables of Sinara
+    try:
+        return getattr(dev, f"{name}_fmt")
+    except IndexError:
+        raw = getattr(dev, name)
+        logger.warning("%s has unknown %s ID %d, recorded as is", dev.name, name, raw)
+        return str(raw)
+
+
+def _slot(ports: Union[int, List[int], None]) -> Optional[int]:
+    # slot numbers from discover_peripherals, port lists from DIOT discovery
+    # and SystemDescription - a board is located by its first port
+    if ports is None or isinstance(ports, int):
+        return ports
+    return ports[0] if ports else None
+
+
+class Inventory:
+    """Board inventory stored in SQLite database ``path`` (in memory by
+    default)."""
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> "Inventory":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def record(
+        self,
+        crate: str,
+        peripherals: Iterable[Tuple[Sinara, Union[int, List[int]]]],
+        controller: Optional[Sinara] = None,
+        timestamp: Optional[float] = None,
+    ) -> List[Move]:
+        """Record the result of a discovery of ``crate`` (EUI-48 of its Kasli):
+        ``(device, slot or ports)`` pairs and optionally the ``controller``
+        itself (stored without a slot).
+
+        Boards of the crate not found any more are marked absent. Returns
+        moves of boards last seen at another location.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        found = [(dev, _slot(ports)) for dev, ports in peripherals]
+        if controller is not None:
+            found.append((controller, None))
+
+        moves = []
+        seen = []
+        with self._db:
+            for dev, slot in found:
+                eui48 = dev.eui48_fmt
+                if eui48 == _NO_EUI48:
+                    logger.warning(
+                        "%s in crate %s slot %s has no EUI-48, not recorded",
+                        dev.name,
+                        crate,
+                        slot,
+                    )
+                    continue
+                seen.append(eui48)
+                move = self._upsert(dev, eui48, crate, slot, timestamp)
+                if move is not None:
+                    moves.append(move)
+            self._db.execute(
+                "UPDATE boards SET present = 0 WHERE crate = ? AND present"
+                f" AND eui48 NOT IN ({', '.join('?' * len(seen))})",
+                (crate, *seen),
+            )
+        return moves
+
+    def _upsert(
+        self, dev: Sinara, eui48: str, crate: str, slot: Optional[int], timestamp: float
+    ) -> Optional[Move]:
+        row = self._db.execute(
+            "SELECT crate, slot FROM boards WHERE eui48 = ?", (eui48,)
+        ).fetchone()
+        fields = (
+            _field(dev, "board"),
+            dev.hw_rev,
+            _field(dev, "variant"),
+            _field(dev, "vendor"),
+        )
+        if row is None:
+            self._db.execute(
+                "INSERT INTO boards VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)",
+                (eui48, *fields, crate, slot, timestamp, timestamp),
+            )
+            return None
+
+        self._db.execute(
+            "UPDATE boards SET board = ?, hw_rev = ?, variant = ?, vendor = ?,"
+            " crate = ?, slot = ?, present = 1, last_seen = ? WHERE eui48 = ?",
+            (*fields, crate, slot, timestamp, eui48),
+        )
+        if tuple(row) == (crate, slot):
+            return None
+        move = Move(eui48, timestamp, *row, crate, slot)
+        self._db.execute("INSERT INTO moves VALUES (?, ?, ?, ?, ?, ?)", move)
+        return move
+
+    def record_description(
+        self, description, timestamp: Optional[float] = None
+    ) -> List[Move]:
+        """Record boards of a ``SystemDescription``, located in the crate of
+        its controller."""
+        controller = description.controller
+        return self.record(
+            controller.eui48_fmt, description.devs, controller, timestamp
+        )
+
+    def record_kasli(self, kasli, timestamp: Optional[float] = None) -> List[Move]:
+        """Record peripherals found by the last ``discover_peripherals()`` of
+        ``kasli`` (``KasliI2C`` or ``KasliDIOT``)."""
+        controller = kasli.sinara_eeprom
+        diot_peripherals = getattr(kasli, "diot_peripherals", None)
+        if diot_peripherals is not None:
+            from sinara_mgmt.kasli_diot import unwrap_from_diot
+
+            peripherals = unwrap_from_diot(p for p in diot_peripherals if p)
+        else:
+            peripherals = kasli.eem_peripherals
+        return self.record(controller.eui48_fmt, peripherals, controller, timestamp)
+
+    def _boards(self, where: str = "", args: tuple = ()) -> List[BoardRecord]:
+        query = f"SELECT {', '.join(_BOARD_COLUMNS)} FROM boards"
+        if where:
+            query += f" WHERE {where}"
+        query += " ORDER BY crate, slot, eui48"
+        return [
+            BoardRecord(*row[:7], bool(row[7]), *row[8:])
+            for row in self._db.execute(query, args)
+        ]
+
+    def locate(self, eui48: str) -> Optional[BoardRecord]:
+        """Board with ``eui48`` (in ``xx-xx-xx-xx-xx-xx`` format) and its
+        current (or last known, if not present) location."""
+        boards = self._boards("eui48 = ?", (eui48.lower(),))
+        return boards[0] if boards else None
+
+    def find(
+        self,
+        board: Optional[str] = None,
+        hw_rev: Optional[str] = None,
+        variant: Optional[str] = None,
+        crate: Optional[str] = None,
+        present: Optional[bool] = True,
+    ) -> List[BoardRecord]:
+        """Boards matching all the given criteria (only present ones by
+        default, ``present=None`` includes absent boards)."""
+        conditions = []
+        args = []
+        for column, value in (
+            ("board", board),
+            ("hw_rev", hw_rev),
+            ("variant", variant),
+            ("crate", crate),
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                args.append(value)
+        if present is not None:
+            conditions.append("present = ?")
+            args.append(int(present))
+        return self._boards(" AND ".join(conditions), tuple(args))
+
+    def crates(self, board: str, hw_rev: Optional[str] = None) -> List[str]:
+        """Crates with a present ``board`` (of revision ``hw_rev``)."""
+        query = "SELECT DISTINCT crate FROM boards WHERE board = ? AND present"
+        args = (board,)
+        if hw_rev is not None:
+            query += " AND hw_rev = ?"
+            args += (hw_rev,)
+        return [row[0] for row in self._db.execute(query + " ORDER BY crate", args)]
+
+    def moves(self, eui48: Optional[str] = None) -> List[Move]:
+        """Recorded moves (of board ``eui48`` only, if given), oldest first."""
+        query = "SELECT * FROM moves"
+        args = ()
+        if eui48 is not None:
+            query += " WHERE eui48 = ?"
+            args = (eui48.lower(),)
+        return [
+            Move(*row)
+            for row in self._db.execute(query + " ORDER BY timestamp, rowid", args)
+        ]
@@ -3,6 +3,9 @@
 #
 # SPDX-License-Identifier: MIT
 import os
+import threading
+import time
+from collections import namedtuple
 
 import digitalio
 from adafruit_blinka.microcontroller.ftdi_mpsse.mpsse.i2c import I2C as _I2C
@@ -10,9 +13,19 @@ from adafruit_blinka.microcontroller.ftdi_mpsse.mpsse.pin import Pin
 from adafruit_bus_device import i2c_device
 from adafruit_mcp230xx.mcp23017 import MCP23017
 from busio import I2C
+from pyftdi.i2c import I2cNackError
 
+from sinara_mgmt.bus_recovery import clock_out, find_controller, sda_low
 from sinara_mgmt.chips.eeprom_24aa025e48 import EEPROM24AA02E48, EEPROM24AA025E48
 from sinara_mgmt.chips.tca9548a import TCA9548A
+from sinara_mgmt.lazy_sinara import (
+    SINARA_HEADER_LENGTH,
+    SINARA_IDENT_LENGTH,
+    SINARA_IDENT_OFFSET,
+    LazySinara,
+)
+from sinara_mgmt.mpsse_batch import MpsseBatch
+from sinara_mgmt.profiling import profiled, span
 from sinara_mgmt.sinara import Sinara
 
 
@@ -21,11 +34,32 @@ def patched_scan_method(self, write=False):
     return [addr for addr in range(0x79) if self._i2c.poll(addr, write)]
 
 
-_I2C.scan = patched_scan_method
+def patch_scan_method():
+    # applied when the first Kasli is opened rather than at import time, so
+    # importing this module does not change the behaviour of Blinka's I2C
+    _I2C.scan = patched_scan_method
+
+
+# raw pin levels of a SFP cage, in order of the expander pins
+SFPStatus = namedtuple(
+    "SFPStatus",
+    (
+        "tx_fault",
+        "tx_disable",
+        "rate_select1",
+        "rate_select",
+        "mod_present",
+        "los",
+        "led",
+    ),
+)
 
 
 class SFPIO:
     def __init__(self, expander: MCP23017, offset: int):
+        self._expander = expander
+        self._offset = offset
+
         self.led = expander.get_pin(6 + offset)
         self.led.direction = digitalio.Direction.OUTPUT
 
@@ -52,21 +86,58 @@ class SFPIO:
         self.tx_fault = expander.get_pin(0 + offset)
         self.tx_fault.direction = digitalio.Direction.INPUT
 
+    @property
+    def status(self) -> SFPStatus:
+        """Levels of all pins of the SFP cage, read with a single expander
+        GPIO read.
+        """
+        gpio = self._expander.gpio >> self._offset
+        return SFPStatus(*(bool(gpio & (1 << pin)) for pin in range(7)))
 
-class KasliI2C(I2C):
-    scan_blacklist = [0x70, 0x71]
 
-    def __init__(self, url="ftdi://ftdi:4232:/2", frequency=100000):
-        os.environ["BLINKA_FT2232H_2"] = url
-        self._i2c = _I2C(2, frequency=frequency)
+# FTDI GPIO pins (of interface 2) driving the I2C muxes
+MUX_ENABLE_PIN = 6
+MUX_RESET_PIN = 5
+
+
+def open_ftdi(url="ftdi://ftdi:4232:/2", frequency=100000):
+    """Open Kasli's FTDI I2C interface and enable the I2C muxes."""
+    patch_scan_method()
+    os.environ["BLINKA_FT2232H_2"] = url
+    i2c = _I2C(2, frequency=frequency)
+
+    enable = Pin(MUX_ENABLE_PIN, 2)
+    enable.init(Pin.OUT)
+    enable.value(1)
+
+    reset = Pin(MUX_RESET_PIN, 2)
+    reset.init(Pin.OUT)
+    reset.value(0)
+
+    return i2c
 
-        enable = Pin(6, 2)
-        enable.init(Pin.OUT)
-        enable.value(1)
 
-        reset = Pin(5, 2)
-        reset.init(Pin.OUT)
-        reset.value(0)
+class KasliI2C(I2C):
+    scan_blacklist = [0x70, 0x71]
+    # time (in seconds) allowed for recovering a stuck bus and retrying
+    # a failed transaction
+    recovery_budget = 0.05
+
+    @profiled()
+    def __init__(self, url="ftdi://ftdi:4232:/2", frequency=100000, i2c=None):
+        # i2c - already opened bus (e.g. a recording or replay of a trace,
+        # see sinara_mgmt.trace), used instead of opening the FTDI at url
+        if i2c is None:
+            i2c = open_ftdi(url, frequency)
+            self.mux_enable = Pin(MUX_ENABLE_PIN, 2)
+            self.mux_reset = Pin(MUX_RESET_PIN, 2)
+        else:
+            self.mux_enable = self.mux_reset = None
+        self._i2c = i2c
+        self.bus_recoveries = 0
+        # reentrant bus lock (see try_lock()) - code accessing the bus from
+        # several threads should hold it
+        self.bus_lock = threading.RLock()
 
         # I2C muxes and bus definitions
         self.tca0 = TCA9548A(self, address=0x70)
@@ -114,14 +185,97 @@ class KasliI2C(I2C):
         # EEPROM
         self.eeprom = EEPROM24AA025E48(self.bus_shared, 0x57)
 
+    def try_lock(self):
+        # reentrant, unlike busio's: a thread keeping a multiplexer channel
+        # selected (TCA9548A_Channel.selected) holds the lock and still locks
+        # the bus for each device access inside
+        return self.bus_lock.acquire(blocking=False)
+
+    def unlock(self):
+        self.bus_lock.release()
+
+    def close(self):
+        """close the FTDI interface (and a trace recording or replay the bus
+        was opened with)
+        """
+        controller = find_controller(self._i2c)
+        close = getattr(self._i2c, "close", None)
+        if close is not None:
+            close()
+        if controller is not None:
+            controller.close()
+
     def scan(self, write=False):
         # Override method from busio.i2c.scan, so it accepts one positional
         # argument
         return self._i2c.scan(write)
 
+    def bus_stuck(self):
+        """check if a slave holds SDA low (only detectable on the FTDI)"""
+        controller = find_controller(self._i2c)
+        return controller is not None and sda_low(controller)
+
+    def recover_bus(self):
+        """release a stuck bus: clock out the slave holding SDA, reset the
+        I2C muxes and restore their channel selection (held or of the
+        interrupted operation); returns True if SDA is released afterwards
+        """
+        controller = find_controller(self._i2c)
+        if controller is None:
+            return False
+        self.bus_recoveries += 1
+        clock_out(controller)
+        if self.mux_reset is not None:
+            self.mux_reset.value(1)
+            self.mux_reset.value(0)
+        for tca in (self.tca0, self.tca1):
+            if tca.selection is not None:
+                self._i2c.writeto(tca.address, tca.selection.channel_switch)
+        return not sda_low(controller)
+
+    def _with_recovery(self, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except I2cNackError:
+            raise
+        except OSError:
+            if not self.bus_stuck():
+                raise
+        deadline = time.monotonic() + self.recovery_budget
+        while True:
+            self.recover_bus()
+            try:
+                return func(*args, **kwargs)
+            except I2cNackError:
+                raise
+            except OSError:
+                if time.monotonic() > deadline or not self.bus_stuck():
+                    raise
+
+    def readfrom_into(self, address, buffer, **kwargs):
+        return self._with_recovery(super().readfrom_into, address, buffer, **kwargs)
+
+    def writeto(self, address, buffer, **kwargs):
+        if address not in (self.tca0.address, self.tca1.address):
+            return self._with_recovery(super().writeto, address, buffer, **kwargs)
+        # multiplexer channel switch - selecting a channel (or restoring the
+        # held one) or releasing all channels
+        name = "mux select" if any(buffer) else "mux release"
+        with span(name, {"address": address}):
+            return self._with_recovery(super().writeto, address, buffer, **kwargs)
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, **kwargs):
+        # register reads, e.g. of EEPROMs
+        with span("I2C read", {"address": address}):
+            return self._with_recovery(
+                super().writeto_then_readfrom, address, buffer_out, buffer_in, **kwargs
+            )
+
     @property
     def sinara_eeprom(self):
-        return Sinara.unpack(bytes(self.eeprom.contents))
+        contents = bytes(self.eeprom.contents)
+        with span("Sinara.unpack"):
+            return Sinara.unpack(contents)
 
     def print_bus_addresses(self, bus, prefix="\t"):
         for adr in bus.scan(write=True):
@@ -136,13 +290,71 @@ class KasliI2C(I2C):
         #     print(f"EEM{idx}:")
         #     self.print_bus_addresses(bus)
 
+    def batch(self):
+        """queue of transactions sent with as few USB round trips as
+        possible (see sinara_mgmt.mpsse_batch); queue and execute it inside
+        ``with`` to hold the bus lock throughout
+        """
+        return MpsseBatch(self)
+
+    def queue_on_channel(self, batch, channel, queue_op):
+        # queued counterpart of TCA9548A_Channel._channel_op: select the mux
+        # channel, queue_op() and restore the previous selection
+        tca = channel.tca
+        if tca.held is channel:
+            return queue_op()
+        batch.write(tca.address, channel.channel_switch)
+        result = queue_op()
+        batch.write(tca.address, tca.held.channel_switch if tca.held else b"\x00")
+        return result
+
+    def _execute(self, batch):
+        results = batch.execute()
+        # a failed mux switch invalidates everything after it
+        for result in results:
+            if result.address in (self.tca0.address, self.tca1.address):
+                result.result()
+        return results
+
     def discover_peripherals(self):
+        # probe EEPROMs on all EEMs in one batch, then read the EUI-48 and
+        # header of the ones present in another, one transaction per EEPROM
+        # (see lazy_sinara); the rest of each EEPROM is read on demand.
+        # The bus stays locked from queuing to execution, so the multiplexer
+        # selection the batch restores cannot change in between.
+        with self.batch() as batch:
+            with span("probe EEMs"):
+                probes = [
+                    self.queue_on_channel(batch, eem_bus, lambda: batch.write(0x50))
+                    for eem_bus in self.bus_eem
+                ]
+                self._execute(batch)
+            present = [slot for slot, probe in enumerate(probes) if probe.ok]
+
+            with span("read EEM EEPROM headers"):
+                reads = [
+                    self.queue_on_channel(
+                        batch,
+                        self.bus_eem[slot],
+                        lambda: batch.write_read(
+                            0x50, bytes((SINARA_IDENT_OFFSET,)), SINARA_IDENT_LENGTH
+                        ),
+                    )
+                    for slot in present
+                ]
+                self._execute(batch)
+
         eem_peripherals = []
-        for slot, eem_bus in enumerate(self.bus_eem):
+        for slot, read in zip(present, reads):
             try:
-                eem_dev = self.identify_eem(eem_bus)
+                ident = bytes(read.result())
+                with span("identify EEM", {"slot": slot}):
+                    eem_dev = self._lazy_sinara(self.bus_eem[slot], ident)
             except ValueError as e:
-                raise ValueError(f"{e} on slot {slot}")
+                # header read while a slave held SDA low is all zeros
+                if not (self.bus_stuck() and self.recover_bus()):
+                    raise ValueError(f"{e} on slot {slot}")
+                eem_dev = self.identify_eem(self.bus_eem[slot])
             if eem_dev is not None:
                 eem_peripherals.append((eem_dev, slot))
 
@@ -155,9 +367,16 @@ class KasliI2C(I2C):
         except ValueError:
             return None
 
-        ee = EEPROM24AA02E48(eem_bus, address=0x50)
-        ee_contents_bytes = bytes(ee.contents)
-        try:
-            return Sinara.unpack(ee_contents_bytes)
-        except ValueError as e:
-            raise e
+        ee = EEPROM24AA02E48(eem_bus, address=0x50, probe=False)
+        ident = ee.read(SINARA_IDENT_OFFSET, SINARA_IDENT_LENGTH)
+        with span("identify EEM"):
+            return self._lazy_sinara(eem_bus, ident)
+
+    @staticmethod
+    def _lazy_sinara(eem_bus, ident):
+        def read_body():
+            # present since discovery - no probe
+            ee = EEPROM24AA02E48(eem_bus, address=0x50, probe=False)
+            return ee.read(SINARA_HEADER_LENGTH)
+
+        return LazySinara.from_ident(ident, read_body)
@@ -2,13 +2,29 @@
 #
 # SPDX-License-Identifier: MIT
 
+import functools
+from contextlib import contextmanager, nullcontext
+
 import digitalio
 from adafruit_bus_device import i2c_device
 
 from sinara_mgmt.chips.eeprom_24aa025e48 import EEPROM24AA02E48, EEPROM24AA025E48
 from sinara_mgmt.chips.pca9539 import PCA9539
 from sinara_mgmt.kasli import KasliI2C
-from sinara_mgmt.sinara import Sinara
+from sinara_mgmt.lazy_sinara import (
+    SINARA_HEADER_LENGTH,
+    SINARA_IDENT_LENGTH,
+    SINARA_IDENT_OFFSET,
+    LazySinara,
+)
+from sinara_mgmt.profiling import profiled, span
+
+# servmod lines of DIOT slots 0..7 are connected to pins 1..8 of adapter_expander1
+SERVMOD_OFFSET = 1
+# EEM I2C bus enable lines of EEM DIOT adapters are pins 15 and 14 of
+# adapter_expander0
+EN_I2C0_PIN = 15
+EN_I2C1_PIN = 14
 
 
 def map_to_eem(slot_no, diot_peripheral):
@@ -38,8 +54,9 @@ def unwrap_from_diot(diot_peripherals):
 
 
 class KasliDIOT(KasliI2C):
-    def __init__(self, url="ftdi://ftdi:4232:/2", frequency=100000):
-        super().__init__(url=url, frequency=frequency)
+    @profiled()
+    def __init__(self, url="ftdi://ftdi:4232:/2", frequency=100000, i2c=None):
+        super().__init__(url=url, frequency=frequency, i2c=i2c)
 
         self.mon_i2c = self.tca1[4]
         self.cpcis_i2c = self.tca1[5]
@@ -52,14 +69,41 @@ class KasliDIOT(KasliI2C):
             self.adapter_logic_i2c, address=0x75, reset=False
         )
 
+        # EEM I2C enable lines (bit N - EEM N of an adapter), shared by
+        # adapters in all slots - outputs while any adapter is attached
+        self.en_i2c = self.adapter_expander0.get_pins((EN_I2C0_PIN, EN_I2C1_PIN))
+
         self.adapter_eeprom0 = EEPROM24AA025E48(self.adapter_logic_i2c, address=0x50)
         self.adapter_eeprom1 = EEPROM24AA02E48(self.adapter_logic_i2c, address=0x57)
 
-        self.servmods = [self.adapter_expander1.get_pin(slot + 1) for slot in range(8)]
+        self.servmods = [
+            self.adapter_expander1.get_pin(slot + SERVMOD_OFFSET) for slot in range(8)
+        ]
+        # all servmod lines as one bit vector (bit N - slot N)
+        self.servmod_pins = self.adapter_expander1.get_pins(
+            range(SERVMOD_OFFSET, SERVMOD_OFFSET + 8)
+        )
         self.ext9_mux_sel, self.ext11_mux_sel = self.adapter_expander1.get_pin(
             9
         ), self.adapter_expander1.get_pin(10)
         self.diot_peripherals = [None for i in range(8)]
+        self._servmods_configured = False
+        self._attached = set()
+
+    def probe_diot_slots(self):
+        """return a bitmap of occupied DIOT slots (bit N set if a peripheral
+        is inserted in slot N)
+
+        All servmod pins are switched to inputs once (at most a single
+        configuration register write), afterwards every call costs a single
+        GPIO read of adapter_expander1.
+        """
+        if not self._servmods_configured:
+            self.servmod_pins.switch_to_input()
+            self._servmods_configured = True
+
+        # if a board is inserted it should pull the servmod line LOW
+        return ~self.servmod_pins.value & 0xFF
 
     def probe_diot_slot(self, slot):
         """check if a peripheral is inserted in the given slot
@@ -68,49 +112,90 @@ class KasliDIOT(KasliI2C):
         """
 
         assert slot in range(8)
-        servmod = self.adapter_expander1.get_pin(slot + 1)
-        servmod.direction = digitalio.Direction.INPUT
-
-        # if a board is inserted it should pull the servmod
-        # line LOW
-        return not servmod.value
+        return bool(self.probe_diot_slots() & (1 << slot))
 
     def probe_peripheral(self, slot):
         assert slot in range(8)
-        servmod = self.servmods[slot]
-        servmod.direction = digitalio.Direction.INPUT
-
-        if servmod.value is False:  # peripheral board inserted in a given slot
-            # make sure that shared I2C bus is enabled
-            en_i2c0, en_i2c1 = self.adapter_expander0.get_pin(
-                16
-            ), self.adapter_expander0.get_pin(15)
-            en_i2c0.direction = digitalio.Direction.OUTPUT
-            en_i2c1.direction = digitalio.Direction.OUTPUT
-            en_i2c0.value = False
-            en_i2c1.value = False
-
-            servmod.direction = digitalio.Direction.OUTPUT
-            servmod.value = True
-
-            edapter = EemDiotAdapter(self.cpcis_i2c, en_i2c0, en_i2c1)
-
-            # release pins
-            servmod.direction - digitalio.Direction.INPUT
-            en_i2c0.direction = digitalio.Direction.INPUT
-            en_i2c1.direction = digitalio.Direction.INPUT
-
-            return edapter
-        else:
+        if not self.probe_diot_slot(slot):
             return None
+        with self.attached(slot):
+            return self._attach_peripheral(slot)
+
+    @contextmanager
+    def attached(self, slot):
+        """drive the servmod line of the given slot for the duration of
+        the block, holding the bus lock; the line is released even if the
+        block fails
+        """
+        with self.bus_lock:
+            if slot in self._attached:
+                # already attached further up the stack of this thread
+                yield
+                return
+            bit = 1 << slot
+            self._attached.add(slot)
+            try:
+                # level and direction of the slot's line only, two writes
+                with self.adapter_expander1.batch():
+                    self.servmod_pins.write(bit, bit)
+                    self.servmod_pins.set_direction(bit, digitalio.Direction.OUTPUT)
+                yield
+            finally:
+                self._attached.discard(slot)
+                try:
+                    self.servmod_pins.set_direction(bit, digitalio.Direction.INPUT)
+                except OSError:
+                    # servmod may still be an output - reconfigure all servmod
+                    # pins on the next probe
+                    self._servmods_configured = False
+                    raise
+
+    def _attach_peripheral(self, slot):
+        # adapter drives both I2C enable lines low (shared bus enabled) and
+        # keeps them as outputs until it is dropped
+        return EemDiotAdapter(
+            self.cpcis_i2c, self.en_i2c, attach=functools.partial(self.attached, slot)
+        )
 
-    def discover_peripherals(self):
-        for slot in range(8):
-            edapter = self.probe_peripheral(slot)
-            if edapter is not None:
+    def _release_enable_lines(self):
+        # the enable lines are shared - released once no adapter is left
+        if not any(self.diot_peripherals):
+            self.en_i2c.switch_to_input()
+
+    def drop_peripheral(self, slot):
+        """forget the peripheral in the given DIOT slot (e.g. after it was
+        removed) and return it
+        """
+        peripheral = self.diot_peripherals[slot]
+        self.diot_peripherals[slot] = None
+        if peripheral is not None:
+            self._release_enable_lines()
+        return peripheral
+
+    def discover_slot(self, slot):
+        """identify peripheral in the given (occupied) DIOT slot
+        and update diot_peripherals accordingly
+        """
+        self.diot_peripherals[slot] = None
+        try:
+            with self.attached(slot):
+                edapter = self._attach_peripheral(slot)
                 edapter.probe_for_eems()  # in case not sinara compatible device
                 edapter.identify_devices()
-                self.diot_peripherals[slot] = (edapter, map_to_eem(slot, edapter))
+        except BaseException:
+            self._release_enable_lines()
+            raise
+        self.diot_peripherals[slot] = (edapter, map_to_eem(slot, edapter))
+        return self.diot_peripherals[slot]
+
+    def discover_peripherals(self):
+        occupied = self.probe_diot_slots()
+        for slot in range(8):
+            if occupied & (1 << slot):
+                with span("discover slot", {"slot": slot}):
+                    self.discover_slot(slot)
+            else:
+                self.drop_peripheral(slot)
 
     def set_slot_mux(self, ext_no, value: bool):
         # accept number of EXT connector for which MUX_sel should be set as an argument
@@ -131,16 +216,16 @@ class KasliDIOT(KasliI2C):
 
 
 class EemDiotAdapter:
-    def __init__(self, i2c_bus, en_i2c0, en_i2c1):
+    def __init__(self, i2c_bus, en_i2c, attach=nullcontext):
+        # en_i2c - PinGroup of the EEM I2C enable lines (bit N - EEM N)
+        # attach - context manager factory attaching the adapter's slot, for
+        # EEPROM reads after discovery
         self._i2c_bus = i2c_bus
-        self._en_i2c0 = en_i2c0
-        self._en_i2c1 = en_i2c1
+        self._en_i2c = en_i2c
+        self._attach = attach
 
         # make sure that shared I2C bus is enabled
-        en_i2c0.direction = digitalio.Direction.OUTPUT
-        en_i2c1.direction = digitalio.Direction.OUTPUT
-        en_i2c0.value = False
-        en_i2c1.value = False
+        en_i2c.switch_to_output(0)
 
         self.adapter_eeprom = EEPROM24AA025E48(self._i2c_bus, address=0x50)
         self.eui48 = self.adapter_eeprom
@@ -161,50 +246,67 @@ class EemDiotAdapter:
 
         return self.identified_eems[0]
 
+    def switch_eem_i2c(self, en_i2c0: bool, en_i2c1: bool):
+        # both enable lines are changed with a single expander register write,
+        # so there is no window with both (or neither) buses enabled
+        self._en_i2c.value = int(en_i2c0) | int(en_i2c1) << 1
+
     def enable_eem_i2c(self, eem_no):
         assert eem_no in [0, 1]
         # make sure that corresponding I2C bus is enabled on EEM DIOT Adapter
-        if eem_no == 0:
-            self._en_i2c0.value, self._en_i2c1.value = True, False
-        else:
-            self._en_i2c0.value, self._en_i2c1.value = False, True
+        self.switch_eem_i2c(eem_no == 0, eem_no == 1)
 
     def release_eem_i2c(self):
-        self._en_i2c0.value, self._en_i2c1.value = False, False
+        self.switch_eem_i2c(False, False)
 
     def probe_for_eems(self):
-        # create i2c_device but do not probe for EEPROM yet - bus needs to be enabled first
-        _i2c_dev = i2c_device.I2CDevice(self.cpcis_i2c, 0x50)
-        for eem_n in range(2):
-            self.eems[eem_n] = self.probe_for_eem(_i2c_dev, eem_n)
-
-        # release both buses
-        self.release_eem_i2c()
+        try:
+            for eem_n in range(2):
+                self.eems[eem_n] = self.probe_for_eem(eem_n, release=False)
+        finally:
+            # release both buses
+            self.release_eem_i2c()
 
-    def probe_for_eem(self, _i2c_dev: i2c_device.I2CDevice, eem_no):
+    def probe_for_eem(self, eem_no, release=True):
         # make sure that corresponding I2C bus is enabled on EEM DIOT Adapter
         self.enable_eem_i2c(eem_no)
         try:
-            _i2c_dev.__probe_for_device()
+            i2c_device.I2CDevice(self._i2c_bus, 0x50, probe=True)
             return True
-        except OSError:
+        except ValueError:
             return None
         finally:
-            self.release_eem_i2c()
+            if release:
+                self.release_eem_i2c()
 
     def identify_devices(self):
-        for eem_no in range(2):
-            self.identified_eems[eem_no] = self.identify_eem(eem_no)
+        try:
+            for eem_no in range(2):
+                self.identified_eems[eem_no] = self.identify_eem(eem_no, release=False)
+        finally:
+            self.release_eem_i2c()
 
-    def identify_eem(self, eem_no):
+    def identify_eem(self, eem_no, release=True):
         if self.eems[eem_no] is None:
             return None
         self.enable_eem_i2c(eem_no)
-        ee = EEPROM24AA02E48(self._i2c_bus, address=0x50)
-        ee_contents_bytes = bytes(ee.contents)
         try:
-            return Sinara.unpack(ee_contents_bytes)
-        except ValueError as e:
-            raise e
+            # probed by probe_for_eems()
+            ee = EEPROM24AA02E48(self._i2c_bus, address=0x50, probe=False)
+            ident = ee.read(SINARA_IDENT_OFFSET, SINARA_IDENT_LENGTH)
+            with span("identify EEM"):
+                return LazySinara.from_ident(
+                    ident, lambda: self.read_eem_eeprom(eem_no, SINARA_HEADER_LENGTH)
+                )
         finally:
-            self.release_eem_i2c()
+            if release:
+                self.release_eem_i2c()
+
+    def read_eem_eeprom(self, eem_no, offset=0, length=None):
+        with self._attach():
+            self.enable_eem_i2c(eem_no)
+            try:
+                ee = EEPROM24AA02E48(self._i2c_bus, address=0x50, probe=False)
+                return ee.read(offset, length)
+            finally:
+                self.release_eem_i2c()
@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`lazy_sinara`
+====================================================
+
+Identification of Sinara boards from the EEPROM header and EUI-48 alone.
+
+The first 24 bytes of a Sinara EEPROM (CRC, magic, name, board, revisions,
+variant, port and vendor) and the EUI-48 (6 bytes at 0xFA) are all that
+discovery, description generation and the inventory need. Both are fetched
+with a single sequential read of ``SINARA_IDENT_LENGTH`` bytes starting at
+the EUI-48, as the EEPROM address counter rolls over from 0xFF to 0x00.
+``LazySinara`` is built from those bytes, rejects a bad magic immediately and reads the rest of
+the EEPROM (vendor/project/user/board data and read-only pad) once, when one
+of those fields is accessed or ``load()`` is called for full validation.
+
+``LazySinara`` is not a ``Sinara``: fields and properties are available as
+attributes, but it is not a tuple - no indexing, comparison or
+``isinstance(..., Sinara)``. Code needing a ``Sinara`` should call ``load()``.
+
+* Author(s): Jakub Matyas
+"""
+
+import struct
+from typing import Callable
+
+from sinara_mgmt.sinara import Sinara
+
+SINARA_HEADER = struct.Struct(">I H 10s H BBBBBB")
+SINARA_HEADER_LENGTH = SINARA_HEADER.size
+SINARA_EUI48_OFFSET = 0xFA
+SINARA_EUI48_LENGTH = 6
+# EUI-48 followed by the header, read across the address roll-over
+SINARA_IDENT_OFFSET = SINARA_EUI48_OFFSET
+SINARA_IDENT_LENGTH = SINARA_EUI48_LENGTH + SINARA_HEADER_LENGTH
+
+# attributes that need more than the header
+_BODY_ATTRIBUTES = frozenset(
+    (
+        "vendor_data",
+        "project_data",
+        "user_data",
+        "board_data",
+        "almazny_hw_rev",
+        "pack",
+        "_asdict",
+        "_replace",
+    )
+)
+
+
+class LazySinara:
+    """Sinara EEPROM contents identified from ``header`` and ``eui48``;
+    ``read_body()`` returns the EEPROM contents following the header.
+
+    Header fields, the EUI-48 and properties derived from them are available
+    right away, anything else loads and unpacks the whole contents first.
+    """
+
+    def __init__(
+        self, header: bytes, eui48: bytes, read_body: Callable[[], bytes]
+    ) -> None:
+        (
+            self.crc,
+            magic,
+            name,
+            *fields,
+        ) = SINARA_HEADER.unpack(header[:SINARA_HEADER_LENGTH])
+        if magic != Sinara._magic:
+            raise ValueError("Invalid magic")
+        self._header = bytes(header[:SINARA_HEADER_LENGTH])
+        # body fields are left at their defaults until loaded
+        self._partial = Sinara(
+            name.strip(b"\x00").decode(), *fields, eui48=bytes(eui48)
+        )
+        self._read_body = read_body
+        self._body = None
+        self._full = None
+        self._checked = False
+
+    @classmethod
+    def from_ident(cls, ident: bytes, read_body: Callable[[], bytes]) -> "LazySinara":
+        """Build from ``SINARA_IDENT_LENGTH`` bytes read at
+        ``SINARA_IDENT_OFFSET`` (the EUI-48 followed by the header)."""
+        return cls(
+            ident[SINARA_EUI48_LENGTH:SINARA_IDENT_LENGTH],
+            ident[:SINARA_EUI48_LENGTH],
+            read_body,
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._full is not None
+
+    def load(self, check: bool = True) -> Sinara:
+        """Return the complete ``Sinara``, reading the rest of the EEPROM on
+        the first call (validating the read-only pad and CRC with ``check``,
+        once).
+        """
+        if self._body is None:
+            self._body = bytes(self._read_body())
+        if self._full is None or (check and not self._checked):
+            self._full = Sinara.unpack(self._header + self._body, check)
+            self._checked = check
+        return self._full
+
+    def __getattr__(self, name):
+        if name in _BODY_ATTRIBUTES:
+            return getattr(self.load(check=False), name)
+        return getattr(self._partial, name)
+
+    def __repr__(self) -> str:
+        if self._full is not None:
+            return repr(self._full)
+        return f"LazySinara({self._partial.name!r}, {self._partial.hw_rev})"
@@ -0,0 +1,223 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`mpsse_batch`
+====================================================
+
+Batching of I2C transactions into MPSSE command buffers.
+
+pyftdi checks the ACK of every byte with its own USB round trip, so USB
+latency dominates every I2C transaction. ``MpsseBatch`` queues whole
+transactions (e.g. mux select, EEPROM read, mux release), builds the MPSSE
+commands for all of them and sends them with as few USB writes as the FTDI
+FIFOs allow. Results are read back afterwards and demultiplexed into
+per-transaction ACK status and data.
+
+Unlike sequential transactions, a NACKed transaction is still clocked to
+its end before its STOP condition (the remaining bytes go to no device);
+its result reports the NACK.
+
+Only a bus talking to the FTDI directly through Blinka's I2C interface is
+batched. Any other bus, including one wrapped by a trace recording (which
+must see every transaction) or one not backed by an FTDI (trace replay,
+simulation), runs the queued transactions one by one through its own
+methods.
+
+``execute()`` holds the bus lock (``try_lock()``/``unlock()`` of the bus) while
+it runs. Transactions queued with the current multiplexer selection in mind
+(see ``KasliI2C.queue_on_channel``) should be queued and executed inside
+``with batch:``, which holds the lock for the whole block.
+
+* Author(s): Jakub Matyas
+"""
+
+import time
+from typing import List, Optional
+
+from adafruit_blinka.microcontroller.ftdi_mpsse.mpsse.i2c import I2C as _I2C
+from pyftdi.i2c import I2cController, I2cIOError, I2cNackError
+
+# kinds of response bytes
+_ACK = 1
+_DATA = 2
+
+
+def _direct_controller(bus) -> Optional[I2cController]:
+    # pyftdi controller of bus (Blinka's I2C) or of the Blinka I2C bus
+    # wraps directly (KasliI2C); None if anything else is in between
+    if not isinstance(bus, _I2C):
+        bus = getattr(bus, "_i2c", None)
+    controller = getattr(bus, "_i2c", None) if isinstance(bus, _I2C) else None
+    return controller if isinstance(controller, I2cController) else None
+
+
+class BatchResult:
+    """Outcome of a queued transaction, filled in by ``MpsseBatch.execute()``."""
+
+    __slots__ = ("address", "data", "error")
+
+    def __init__(self, address: int) -> None:
+        self.address = address
+        self.data = bytearray()
+        self.error = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def result(self) -> bytearray:
+        """Data read by the transaction; raises the error it failed with."""
+        if self.error is not None:
+            raise self.error
+        return self.data
+
+
+class MpsseBatch:
+    """Queue of I2C transactions on ``bus`` (``KasliI2C`` or any object with
+    Blinka's I2C interface) executed together by ``execute()``.
+    """
+
+    def __init__(self, bus) -> None:
+        self._bus = bus
+        self._controller = _direct_controller(bus)
+        self._ops = []
+        self._lock_depth = 0
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def _lock(self) -> None:
+        if not self._lock_depth:
+            while not self._bus.try_lock():
+                time.sleep(0)
+        self._lock_depth += 1
+
+    def _unlock(self) -> None:
+        self._lock_depth -= 1
+        if not self._lock_depth:
+            self._bus.unlock()
+
+    def __enter__(self) -> "MpsseBatch":
+        self._lock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._unlock()
+
+    def _queue(self, address: int, data: Optional[bytes], length: int) -> BatchResult:
+        result = BatchResult(address)
+        self._ops.append((address, data, length, result))
+        return result
+
+    def write(self, address: int, data: bytes = b"") -> BatchResult:
+        """Queue a write (with empty ``data`` - an address-only probe)."""
+        return self._queue(address, bytes(data), 0)
+
+    def read(self, address: int, length: int) -> BatchResult:
+        return self._queue(address, None, length)
+
+    def write_read(self, address: int, data: bytes, length: int) -> BatchResult:
+        """Queue a write followed by a read after a repeated start."""
+        return self._queue(address, bytes(data), length)
+
+    def execute(self) -> List[BatchResult]:
+        """Run all queued transactions and return their results in order."""
+        ops, self._ops = self._ops, []
+        self._lock()
+        try:
+            if self._controller is None:
+                self._execute_sequential(ops)
+            else:
+                self._execute_mpsse(ops)
+        finally:
+            self._unlock()
+        return [op[3] for op in ops]
+
+    def _execute_sequential(self, ops) -> None:
+        for address, data, length, result in ops:
+            buffer = bytearray(length)
+            try:
+                if data is None:
+                    self._bus.readfrom_into(address, buffer)
+                elif length:
+                    self._bus.writeto_then_readfrom(address, data, buffer)
+                else:
+                    self._bus.writeto(address, data)
+            except OSError as e:
+                result.error = e
+            else:
+                result.data = buffer
+
+    def _commands(self, ops):
+        # MPSSE commands of every transaction split into atoms of
+        # (command bytes, result, kind of the response byte or None)
+        c = self._controller
+        if c._fake_tristate:
+            check_ack = bytes(c._clk_lo_data_input + c._read_bit + c._clk_lo_data_hi)
+            read_byte = c._clk_lo_data_input + c._read_byte + c._clk_lo_data_hi
+            read_not_last = bytes(read_byte + c._ack + c._clk_lo_data_lo * c._ck_delay)
+            read_last = bytes(read_byte + c._nack + c._clk_lo_data_hi * c._ck_delay)
+        else:
+            check_ack = bytes(c._clk_lo_data_hi + c._read_bit)
+            read_not_last = bytes(
+                c._read_byte + c._ack + c._clk_lo_data_hi * c._ck_delay
+            )
+            read_last = bytes(c._read_byte + c._nack + c._clk_lo_data_hi * c._ck_delay)
+        start = bytes(c._idle * c._ck_delay + c._start + c._write_byte)
+        write_byte = bytes(c._write_byte)
+        stop = bytes(c._stop)
+
+        for address, data, length, result in ops:
+            if data is not None:
+                yield start + bytes((address << 1,)) + check_ack, result, _ACK
+                for byte in data:
+                    yield write_byte + bytes((byte,)) + check_ack, result, _ACK
+            if length:
+                yield start + bytes((address << 1 | 1,)) + check_ack, result, _ACK
+                for _ in range(length - 1):
+                    yield read_not_last, result, _DATA
+                yield read_last, result, _DATA
+            yield stop, None, None
+
+    def _execute_mpsse(self, ops) -> None:
+        c = self._controller
+        # keep every USB write within the TX FIFO and its responses within
+        # the RX FIFO (minus the 2 modem status bytes)
+        tx_limit = c._tx_size - 1
+        rx_limit = c._rx_size - 2
+        immediate = bytes(c._immediate)
+
+        cmd = bytearray()
+        pending = []
+
+        def flush():
+            if not cmd:
+                return
+            cmd.extend(immediate)
+            c.ftdi.write_data(cmd)
+            if pending:
+                response = c.ftdi.read_data_bytes(len(pending), 4)
+                if len(response) != len(pending):
+                    raise I2cIOError("No answer from FTDI")
+                for (result, kind), byte in zip(pending, response):
+                    if kind == _DATA:
+                        result.data.append(byte)
+                    elif byte & 1 and result.error is None:
+                        result.error = I2cNackError(
+                            f"NACK from slave 0x{result.address:02x}"
+                        )
+            cmd.clear()
+            pending.clear()
+
+        with c._lock:
+            for atom, result, kind in self._commands(ops):
+                if len(cmd) + len(atom) > tx_limit or (
+                    kind is not None and len(pending) >= rx_limit
+                ):
+                    flush()
+                cmd.extend(atom)
+                if kind is not None:
+                    pending.append((result, kind))
+            flush()
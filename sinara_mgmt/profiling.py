@@ -0,0 +1,134 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`profiling`
+====================================================
+
+Named profiling spans of the main workflows (Kasli setup, discovery of every
+slot, mux switching, register reads, description generation), exported as
+Chrome trace-event JSON (open in ``chrome://tracing`` or Perfetto).
+
+Profiling is off by default and a span then costs a single global check.
+Set ``SINARA_MGMT_PROFILE=<file.json>`` to record spans of the whole process
+and write them on exit, or use ``enable()`` and ``dump()``.
+
+* Author(s): Jakub Matyas
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Optional
+
+PROFILE_ENV = "SINARA_MGMT_PROFILE"
+
+# recorded spans (name, start [ns], duration [ns], thread id, args), or None
+# when profiling is disabled
+_events = None
+
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: Optional[dict]) -> None:
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        end = time.perf_counter_ns()
+        events = _events
+        if events is not None:
+            events.append(
+                (
+                    self.name,
+                    self.start,
+                    end - self.start,
+                    threading.get_ident(),
+                    self.args,
+                )
+            )
+
+
+def enabled() -> bool:
+    return _events is not None
+
+
+def enable() -> None:
+    """Start recording spans (previously recorded spans are discarded)."""
+    global _events
+    _events = []
+
+
+def disable() -> None:
+    global _events
+    _events = None
+
+
+def span(name: str, args: Optional[dict] = None):
+    """Context manager recording the enclosed block as span ``name`` with
+    optional ``args`` shown in the trace viewer.
+    """
+    if _events is None:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """Decorator recording every call of the function as a span (named after
+    the function by default).
+    """
+
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _events is None:
+                return func(*args, **kwargs)
+            with _Span(label, None):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_events() -> dict:
+    """Recorded spans in the Chrome trace-event format."""
+    pid = os.getpid()
+    events = []
+    for name, start, duration, tid, args in _events or ():
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": start / 1000,
+            "dur": duration / 1000,
+            "pid": pid,
+            "tid": tid,
+        }
+        if args:
+            event["args"] = args
+        events.append(event)
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def dump(filename: str) -> None:
+    with open(filename, "w") as f:
+        json.dump(trace_events(), f)
+
+
+if os.environ.get(PROFILE_ENV):
+    enable()
+    atexit.register(dump, os.environ[PROFILE_ENV])
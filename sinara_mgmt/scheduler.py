@@ -0,0 +1,360 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`scheduler`
+====================================================
+
+Polling of a shared crate bus within a budget of bus time.
+
+SFP status, LM75 sampling, DIOT hot-plug checks and operator commands all go
+through the single FTDI I2C bus of a Kasli. ``PollScheduler`` runs them as
+tasks with a period, a priority and an estimated cost in bus transactions,
+spending at most ``budget`` (a fraction) of wall-clock time on the bus: bus
+time credit accrues at ``budget`` seconds per second, up to
+``budget * window``, and every run is charged the time it actually took.
+Costs are converted to time with a running estimate of the time per
+transaction.
+
+Due tasks are picked in priority order while the credit lasts; the picked
+tasks are then run grouped by multiplexer channel, with the channel held
+selected for the whole group. A task starting more than its deadline (its
+period by default) after it was due is counted as a deadline miss.
+
+Operator commands are submitted with ``submit()``; they run at the next
+opportunity regardless of the credit, but their bus time is charged as well::
+
+    scheduler = PollScheduler(kasli.bus_lock, budget=0.2)
+    scheduler.add(PollTask("sfp0", lambda: kasli.sfpio0.status, 1.0, cost=1))
+    scheduler.add(PollTask("hotplug", watcher.poll, 1.0, priority=1, cost=2))
+    with scheduler:
+        status = scheduler.submit(lambda: kasli.sfpio1.status).result()
+
+* Author(s): Jakub Matyas
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from sinara_mgmt.chips.tca9548a import hold_channel
+
+logger = logging.getLogger(__name__)
+
+# priority of submitted commands unless given otherwise - above polling
+COMMAND_PRIORITY = 100
+
+# weight of the latest run in the time per transaction estimate
+_ESTIMATE_WEIGHT = 0.2
+
+TaskStats = namedtuple(
+    "TaskStats",
+    ("runs", "misses", "errors", "last_latency", "max_latency", "bus_time"),
+)
+
+
+class PollTask:
+    """Run ``func`` every ``period`` seconds (once if ``period`` is None).
+
+    ``cost`` is the estimated number of bus transactions of a run and
+    ``channel`` the multiplexer channel it uses, if any. Tasks with higher
+    ``priority`` are run first. A run starting more than ``deadline``
+    seconds (``period`` by default) after the task was due is a deadline
+    miss.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        period: Optional[float],
+        priority: int = 0,
+        cost: int = 1,
+        channel=None,
+        deadline: Optional[float] = None,
+    ) -> None:
+        if period is not None and period <= 0:
+            raise ValueError("Period must be positive.")
+        self.name = name
+        self.func = func
+        self.period = period
+        self.priority = priority
+        self.cost = cost
+        self.channel = channel
+        self.deadline = period if deadline is None else deadline
+        self.future = None
+
+        self.next_due = None
+        self.runs = 0
+        self.misses = 0
+        self.errors = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.bus_time = 0.0
+
+    @property
+    def stats(self) -> TaskStats:
+        return TaskStats(
+            self.runs,
+            self.misses,
+            self.errors,
+            self.last_latency,
+            self.max_latency,
+            self.bus_time,
+        )
+
+
+class PollScheduler:
+    """Run ``PollTask``s on one bus, spending at most ``budget`` of the time
+    on it (see module documentation).
+
+    The bus is only accessed under ``lock``, which must be the ``bus_lock``
+    of the Kasli the tasks drive, so that runs exclude every other user of
+    the bus (hot-plug watcher, samplers, batches).
+    """
+
+    def __init__(
+        self,
+        lock,
+        budget: float = 0.2,
+        window: float = 1.0,
+        transaction_time: float = 1e-3,
+    ) -> None:
+        if not 0 < budget <= 1:
+            raise ValueError("Budget must be a fraction of time in (0, 1].")
+        self.budget = budget
+        self.window = window
+        self.transaction_time = transaction_time
+        self.lock = lock
+        self.bus_time = 0.0
+
+        self._tasks = {}
+        self._tasks_lock = threading.Lock()
+        self._commands = deque()
+        self._credit = self.capacity
+        self._refilled = None
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+
+    @property
+    def capacity(self) -> float:
+        """Largest bus time credit (in seconds) that can be accumulated."""
+        return self.budget * self.window
+
+    @property
+    def tasks(self) -> List[PollTask]:
+        with self._tasks_lock:
+            return list(self._tasks.values())
+
+    def add(self, task: PollTask, delay: float = 0.0) -> PollTask:
+        """Schedule periodic ``task``, first due in ``delay`` seconds."""
+        if task.period is None:
+            raise ValueError("Use submit() for one-off tasks.")
+        task.next_due = time.monotonic() + delay
+        with self._tasks_lock:
+            if task.name in self._tasks:
+                raise ValueError(f"Task {task.name} already scheduled.")
+            self._tasks[task.name] = task
+        self._wakeup.set()
+        return task
+
+    def remove(self, name: str) -> PollTask:
+        with self._tasks_lock:
+            return self._tasks.pop(name)
+
+    def submit(
+        self,
+        func: Callable,
+        cost: int = 1,
+        channel=None,
+        priority: int = COMMAND_PRIORITY,
+        name: str = "command",
+    ) -> Future:
+        """Run ``func`` once at the next opportunity; returns a ``Future`` of
+        its result."""
+        command = PollTask(name, func, None, priority, cost, channel)
+        command.future = Future()
+        command.next_due = time.monotonic()
+        self._commands.append(command)
+        self._wakeup.set()
+        return command.future
+
+    def estimate(self, task: PollTask) -> float:
+        """Estimated bus time of a run of ``task``."""
+        return task.cost * self.transaction_time
+
+    def stats(self) -> Dict[str, TaskStats]:
+        return {task.name: task.stats for task in self.tasks}
+
+    def _refill(self, now: float) -> None:
+        if self._refilled is not None:
+            self._credit = min(
+                self._credit + (now - self._refilled) * self.budget, self.capacity
+            )
+        self._refilled = now
+
+    def _due(self, now: float) -> List[PollTask]:
+        due = [task for task in self.tasks if task.next_due <= now]
+        while self._commands:
+            due.append(self._commands.popleft())
+        due.sort(key=lambda task: (-task.priority, task.next_due))
+        return due
+
+    def _select(self, due: List[PollTask]) -> List[PollTask]:
+        # commands always run, periodic tasks while the credit lasts - the
+        # first one at full credit even if it is estimated to need more.
+        # Once a periodic task does not fit, lower priority ones wait too
+        # (no overtaking), but commands ranked below it are still taken.
+        selected = []
+        credit = self._credit
+        polling = False
+        exhausted = False
+        for task in due:
+            estimate = self.estimate(task)
+            if task.period is not None:
+                if exhausted or (
+                    estimate > credit and (polling or credit < self.capacity)
+                ):
+                    exhausted = True
+                    continue
+                polling = True
+            credit -= estimate
+            selected.append(task)
+        return selected
+
+    def run_pending(self) -> List[str]:
+        """Run due tasks that fit in the bus time credit; returns their
+        names."""
+        now = time.monotonic()
+        self._refill(now)
+        selected = self._select(self._due(now))
+        # group by channel, groups ordered by their most urgent task
+        groups = {}
+        for task in selected:
+            groups.setdefault(task.channel, []).append(task)
+        for channel, tasks in groups.items():
+            self._run_group(channel, tasks)
+        return [task.name for task in selected]
+
+    def _run_group(self, channel, tasks: List[PollTask]) -> None:
+        start = time.monotonic()
+        try:
+            with self.lock, hold_channel(channel):
+                for task in tasks:
+                    self._run_task(task)
+        except OSError as e:
+            # selecting or releasing the channel failed
+            logger.warning("Polling on channel %s failed: %s", channel, e)
+            for task in tasks:
+                if task.future is not None and not task.future.done():
+                    task.future.set_exception(e)
+        finally:
+            elapsed = time.monotonic() - start
+            self._credit -= elapsed
+            self.bus_time += elapsed
+
+    def _run_task(self, task: PollTask) -> None:
+        if task.future is not None and not task.future.set_running_or_notify_cancel():
+            return
+        start = time.monotonic()
+        latency = start - task.next_due
+        if task.deadline is not None and latency > task.deadline:
+            task.misses += 1
+            logger.warning(
+                "Task %s missed its deadline by %.3f s",
+                task.name,
+                latency - task.deadline,
+            )
+        try:
+            result = task.func()
+        except Exception as e:
+            task.errors += 1
+            if task.future is not None:
+                task.future.set_exception(e)
+            else:
+                logger.warning("Task %s failed: %s", task.name, e)
+        else:
+            if task.future is not None:
+                task.future.set_result(result)
+        elapsed = time.monotonic() - start
+
+        task.runs += 1
+        task.last_latency = latency
+        task.max_latency = max(task.max_latency, latency)
+        task.bus_time += elapsed
+        if task.cost > 0:
+            self.transaction_time += _ESTIMATE_WEIGHT * (
+                elapsed / task.cost - self.transaction_time
+            )
+        if task.period is not None:
+            # skip periods missed altogether instead of bursting
+            skipped = math.floor((start - task.next_due) / task.period)
+            task.next_due += (max(skipped, 0) + 1) * task.period
+
+    def next_run(self) -> Optional[float]:
+        """Monotonic time at which ``run_pending()`` should be called next;
+        None if nothing is scheduled."""
+        if self._commands:
+            return time.monotonic()
+        tasks = self.tasks
+        if not tasks:
+            return None
+        now = time.monotonic()
+        due = [task for task in tasks if task.next_due <= now]
+        if not due:
+            return min(task.next_due for task in tasks)
+        # wait until there is enough credit for the task picked first
+        task = min(due, key=lambda task: (-task.priority, task.next_due))
+        self._refill(now)
+        shortfall = min(self.estimate(task), self.capacity) - self._credit
+        return now + max(shortfall, 0.0) / self.budget
+
+    def start(self) -> None:
+        if self._thread is not None:
+            raise RuntimeError("Scheduler already running")
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="poll-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+        while self._commands:
+            self._commands.popleft().future.cancel()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            self._wakeup.clear()
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Polling failed")
+            next_run = self.next_run()
+            if next_run is None:
+                self._wakeup.wait()
+            else:
+                self._wakeup.wait(max(0.0, next_run - time.monotonic()))
+
+    def __enter__(self) -> "PollScheduler":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
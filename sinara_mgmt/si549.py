@@ -2,7 +2,15 @@
 #
 # SPDX-License-Identifier: MIT
 
+import math
+import struct
+import sys
 import time
+from array import array
+from collections import namedtuple
+from fractions import Fraction
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, Sequence, Tuple
 
 from adafruit_bus_device import i2c_device
 
@@ -21,7 +29,7 @@ SI549_REGISTER_FBDIV_1 = 0x1B
 SI549_REGISTER_FBDIV_2 = 0x1C
 SI549_REGISTER_FBDIV_3 = 0x1D
 SI549_REGISTER_FBDIV_4 = 0x1E
-SI549_REGISTER_FBDIV_5 = 0x3F
+SI549_REGISTER_FBDIV_5 = 0x1F
 SI549_REGISTER_FCAL = 0x45
 SI549_REGISTER_PAGE = 0xFF
 
@@ -36,8 +44,21 @@ SI549_FBDIV_REGS = [
 
 SI549_DEFAULT_ADDRESS = 0x67
 
+# divider registers read back by read_config(): HSDIV (0x17) .. FBDIV_5 (0x1F)
+_DIVIDERS_LENGTH = SI549_REGISTER_FBDIV_5 - SI549_REGISTER_HSDIV + 1
+_FBDIV_OFFSET = SI549_REGISTER_FBDIV_0 - SI549_REGISTER_HSDIV
+_FBDIV_MASK = (1 << 43) - 1
+
 SI549_FOSC = 152.6e6
 
+SI549_RESET_FCAL = 1 << 3  # set to start FCAL, cleared by the device when done
+SI549_FCAL_TIMEOUT = 0.1  # datasheet: 30 ms
+SI549_FCAL_POLL_INTERVAL = 1e-3
+
+# maximum FBDIV change (relative to the value FCAL was run at) that the DCO
+# can follow without recalibration
+SI549_SMALL_CHANGE_PPM = 950
+
 
 LSDIV_RANGE = [i for i in range(8)]
 HSDIV_RANGE = [*[i for i in range(5, 34)], *[i for i in range(34, 2046, 2)]]
@@ -49,42 +70,429 @@ FVCO_RANGE = {
 }
 FOUT_RANGE = {"A": [0.2e6, 1500e6], "B": [0.2e6, 800e6], "C": [0.2e6, 325e6]}
 
+# FBDIV is an unsigned fixed-point number with 32 fractional bits
+FBDIV_FRAC_BITS = 32
+
+Si549Config = namedtuple("Si549Config", ("hsdiv", "lsdiv", "fbdiv"))
+
+
+def _valid_hsdiv(hsdiv: int, lsdiv: int) -> int:
+    # smallest valid HSDIV value not lower than hsdiv: only even values above
+    # 33 or when LSDIV is in use
+    if hsdiv < HSDIV_RANGE[0]:
+        hsdiv = HSDIV_RANGE[0]
+    if hsdiv & 1 and (hsdiv > 33 or lsdiv):
+        hsdiv += 1
+    return hsdiv
+
+
+def _solve_config(frequency: float, grade: str = "C") -> Si549Config:
+    """Compute dividers producing ``frequency`` (in Hz) on a Si549 of the given
+    speed ``grade``.
+
+    Instead of trying every HSDIV/LSDIV pair, the lowest HSDIV bringing the
+    VCO into its range is computed directly for each LSDIV, so the search
+    costs a handful of integer operations. The lowest LSDIV and HSDIV
+    (lowest VCO frequency) that fit are chosen, and FBDIV is rounded from the
+    exact rational VCO/FOSC ratio.
+    """
+    fout_min, fout_max = FOUT_RANGE[grade]
+    if not fout_min <= frequency <= fout_max:
+        raise ValueError(
+            f"Frequency {frequency} Hz out of range for grade {grade} Si549."
+        )
+    fvco_min, fvco_max = (Fraction(f) for f in FVCO_RANGE[grade])
+    fout = Fraction(frequency)
+
+    for lsdiv in LSDIV_RANGE:
+        ls_freq = fout * (1 << lsdiv)
+        hsdiv = _valid_hsdiv(math.ceil(fvco_min / ls_freq), lsdiv)
+        if hsdiv > HSDIV_RANGE[-1]:
+            continue
+        fvco = ls_freq * hsdiv
+        if fvco > fvco_max:
+            # VCO range too narrow for any HSDIV at this output frequency
+            continue
+        fbdiv = round(fvco * (1 << FBDIV_FRAC_BITS) / Fraction(SI549_FOSC))
+        if (fbdiv >> FBDIV_FRAC_BITS) not in FBDIV_INT_RANGE:
+            continue
+        return Si549Config(hsdiv, lsdiv, fbdiv)
+    raise ValueError(f"No valid Si549 divider configuration for {frequency} Hz.")
+
+
+@lru_cache(maxsize=128)
+def solve_config(frequency: float, grade: str = "C") -> Si549Config:
+    """Cached ``_solve_config()``, for retuning between a small set of
+    frequencies; sweep tables solve with the uncached function so they do
+    not evict that working set."""
+    return _solve_config(frequency, grade)
+
+
+def _encode_dividers(hsdiv_val: int, lsdiv_val: int) -> Tuple[int, int]:
+    # HSDIV register holds 8 lower bits of HSDIV, LSDIV register holds LSDIV
+    # and 3 upper bits of HSDIV
+    return hsdiv_val & 0xFF, (lsdiv_val << 4) | ((hsdiv_val >> 8) & 0b111)
+
+
+def config_frequency(config: Si549Config) -> float:
+    """Output frequency (in Hz) produced by ``config``."""
+    fvco = Fraction(SI549_FOSC) * config.fbdiv / (1 << FBDIV_FRAC_BITS)
+    return float(fvco / (config.hsdiv << config.lsdiv))
+
 
 class Si549:
-    def __init__(self, i2c: I2C, address: int = SI549_DEFAULT_ADDRESS) -> None:
+    def __init__(
+        self, i2c: I2C, address: int = SI549_DEFAULT_ADDRESS, grade: str = "C"
+    ) -> None:
+        if grade not in FOUT_RANGE:
+            raise ValueError(f"Unknown Si549 grade: {grade}")
         self._device = i2c_device.I2CDevice(i2c, address, probe=False)
+        self.grade = grade
+        # configuration written during the last full (FCAL) programming
+        self._calibrated = None
+        # register address followed by up to _DIVIDERS_LENGTH data bytes
+        self._buffer = bytearray(1 + _DIVIDERS_LENGTH)
+        # number of write_config() calls skipped as the device already ran
+        # the requested configuration
+        self.skipped_programmings = 0
+        # configuration being calibrated between begin_config() and end_config()
+        self._pending = None
+        # FBDIV value last written by this driver (None if unknown)
+        self._fbdiv = None
 
     def _read_u8(self, address: int) -> int:
-        with self._device as i2c:
-            write_buffer = bytearray([address & 0xFF])
-            read_buffer = bytearray(1)
-            i2c.write_then_readinto(write_buffer, read_buffer)
-        return read_buffer[0]
+        return self._read_block(address, 1)[0]
 
     def _write_u8(self, address: int, value: int) -> None:
-        write_buffer = bytearray([address & 0xFF, value & 0xFF])
+        self._write_block(address, (value,))
+
+    def _read_block(self, address: int, length: int) -> memoryview:
+        # Read ``length`` consecutive registers (register address
+        # auto-increments) in one transaction. Returned view is only valid
+        # until the next register access.
+        buf = self._buffer
+        buf[0] = address & 0xFF
+        with self._device as i2c:
+            i2c.write_then_readinto(buf, buf, out_end=1, in_start=1, in_end=length + 1)
+        return memoryview(buf)[1 : length + 1]
+
+    def _write_block(self, address: int, values: Iterable[int]) -> None:
+        # Write consecutive registers starting at ``address`` in one transaction.
+        buf = self._buffer
+        buf[0] = address & 0xFF
+        end = 1
+        for value in values:
+            buf[end] = value & 0xFF
+            end += 1
         with self._device as i2c:
-            i2c.write(write_buffer)
+            i2c.write(buf, end=end)
+
+    def read_config(self) -> Si549Config:
+        """Read back HSDIV, LSDIV and FBDIV currently programmed in the device
+        (page select write and a single burst read)."""
+        self._write_u8(SI549_REGISTER_PAGE, 0)
+        regs = self._read_block(SI549_REGISTER_HSDIV, _DIVIDERS_LENGTH)
+        hsdiv = regs[0] | ((regs[1] & 0b111) << 8)
+        lsdiv = (regs[1] >> 4) & 0b111
+        fbdiv = int.from_bytes(regs[_FBDIV_OFFSET:], "little") & _FBDIV_MASK
+        return Si549Config(hsdiv, lsdiv, fbdiv)
+
+    def compute_config(self, frequency: float) -> Si549Config:
+        """Return (HSDIV, LSDIV, FBDIV) producing ``frequency`` (in Hz);
+        solutions are cached, so retuning between a set of frequencies
+        solves each of them only once.
+        """
+        return solve_config(float(frequency), self.grade)
+
+    def set_frequency(
+        self, frequency: float, fast: bool = True, force: bool = False
+    ) -> None:
+        self.write_config(*self.compute_config(frequency), fast=fast, force=force)
+
+    def is_programmed(self, hsdiv_val: int, lsdiv_val: int, fbdiv_val: int) -> bool:
+        """Check if the device already runs the given configuration with its
+        output enabled."""
+        if self.read_config() != (hsdiv_val, lsdiv_val, fbdiv_val & _FBDIV_MASK):
+            return False
+        return bool(self._read_u8(SI549_REGISTER_OUTPUT_EN) & 0x01)
+
+    def can_retune(self, hsdiv_val: int, lsdiv_val: int, fbdiv_val: int) -> bool:
+        """Check if the configuration can be reached by updating FBDIV only,
+        i.e. output dividers are unchanged and the VCO stays within the DCO
+        pull range around the last calibrated frequency.
+        """
+        calibrated = self._calibrated
+        if calibrated is None:
+            return False
+        if (hsdiv_val, lsdiv_val) != (calibrated.hsdiv, calibrated.lsdiv):
+            return False
+        delta = abs(fbdiv_val - calibrated.fbdiv)
+        return delta * 1_000_000 <= SI549_SMALL_CHANGE_PPM * calibrated.fbdiv
+
+    def write_config(
+        self,
+        hsdiv_val: int,
+        lsdiv_val: int,
+        fbdiv_val: int,
+        fast: bool = True,
+        timeout: float = SI549_FCAL_TIMEOUT,
+        force: bool = False,
+    ) -> None:
+        """Program dividers.
+
+        With ``fast`` set, small frequency changes (see ``can_retune()``) only
+        rewrite FBDIV, leaving the output running. Otherwise, unless ``force``
+        is set, the live registers are read back first and programming is
+        skipped if the device already runs the requested configuration.
+        A full programming disables the output, writes all dividers and runs
+        FCAL, polling for its completion for at most ``timeout`` seconds.
+        """
+        if self.begin_config(hsdiv_val, lsdiv_val, fbdiv_val, fast=fast, force=force):
+            self.wait_fcal(timeout)
+            self.end_config()
 
-    def compute_config(self, frequency):
-        raise NotImplementedError
+    def begin_config(
+        self,
+        hsdiv_val: int,
+        lsdiv_val: int,
+        fbdiv_val: int,
+        fast: bool = True,
+        force: bool = False,
+    ) -> bool:
+        """First phase of ``write_config()``: apply a fast retune, skip
+        programming, or write the dividers and start FCAL.
+
+        Returns True if FCAL was started - ``end_config()`` must then be called
+        once ``fcal_done()`` reports completion.
+        """
+        if fast and self.can_retune(hsdiv_val, lsdiv_val, fbdiv_val):
+            # page was set to 0 by the full programming that made the device
+            # retunable, only FBDIV registers that change are written
+            self._write_fbdiv(fbdiv_val)
+            return False
+
+        if not force and self.is_programmed(hsdiv_val, lsdiv_val, fbdiv_val):
+            self.skipped_programmings += 1
+            # the live FBDIV is known now, but not the FCAL point (an earlier
+            # process may have retuned away from it) - _calibrated stays
+            # anchored to FCALs run by this driver only
+            self._fbdiv = fbdiv_val
+            return False
 
-    def write_config(self, hsdiv_val, lsdiv_val, fbdiv_val):
         # get device ready for update
         self._write_u8(SI549_REGISTER_PAGE, 0)  # set page register to 0
         self._write_u8(SI549_REGISTER_FCAL, 0)  # disable FCAL override
         self._write_u8(SI549_REGISTER_OUTPUT_EN, 0)  # synchronously disable output
 
-        # update dividers
-        register_value = hsdiv_val & 0xFF  # contains only 8 lower bits of HSDIV
-        self._write_u8(SI549_REGISTER_HSDIV, register_value)
-        register_value = (lsdiv_val << 4) | ((hsdiv_val >> 8) & 0b11)
-        self._write_u8(SI549_REGISTER_LSDIV, register_value)
-        for i, reg_address in enumerate(SI549_FBDIV_REGS):
-            register_value = (fbdiv_val >> 8 * i) & 0xFF
+        # update dividers - HSDIV/LSDIV pair and FBDIV in one burst each
+        self._write_block(SI549_REGISTER_HSDIV, _encode_dividers(hsdiv_val, lsdiv_val))
+        self._fbdiv = None
+        self._write_fbdiv(fbdiv_val)
 
         # startup device
-        register_value = 1 << 3  # initiate FCAL
-        self._write_u8(SI549_REGISTER_RESET, register_value)
-        time.sleep(0.5)  # internal FCAL VCO calibration; 30 ms delay required
+        self._calibrated = None
+        self._pending = Si549Config(hsdiv_val, lsdiv_val, fbdiv_val)
+        self._write_u8(SI549_REGISTER_RESET, SI549_RESET_FCAL)  # initiate FCAL
+        return True
+
+    def end_config(self) -> None:
+        """Last phase of ``write_config()``: enable output after FCAL."""
+        if self._pending is None:
+            raise RuntimeError("No Si549 programming in progress")
+        self._calibrated, self._pending = self._pending, None
         self._write_u8(SI549_REGISTER_OUTPUT_EN, 0x01)  # enable output
+
+    def _write_fbdiv(self, fbdiv_val: int) -> None:
+        # FBDIV registers (LSB first) in a single auto-increment burst, limited
+        # to the span of bytes that differ from the last written value
+        first, last = 0, len(SI549_FBDIV_REGS) - 1
+        if self._fbdiv is not None:
+            diff = self._fbdiv ^ fbdiv_val
+            if not diff:
+                return
+            while not (diff >> 8 * first) & 0xFF:
+                first += 1
+            while not (diff >> 8 * last) & 0xFF:
+                last -= 1
+        self._write_block(
+            SI549_FBDIV_REGS[first],
+            ((fbdiv_val >> 8 * i) & 0xFF for i in range(first, last + 1)),
+        )
+        self._fbdiv = fbdiv_val
+
+    def fcal_done(self) -> bool:
+        try:
+            return not self._read_u8(SI549_REGISTER_RESET) & SI549_RESET_FCAL
+        except OSError:
+            # device may not respond while calibrating
+            return False
+
+    def wait_fcal(self, timeout: float = SI549_FCAL_TIMEOUT) -> None:
+        """Poll until internal FCAL VCO calibration completes."""
+        deadline = time.monotonic() + timeout
+        while not self.fcal_done():
+            if time.monotonic() > deadline:
+                raise TimeoutError("Si549 FCAL did not complete")
+            time.sleep(SI549_FCAL_POLL_INTERVAL)
+
+
+def write_configs(
+    configs: Dict[Si549, Sequence[int]],
+    fast: bool = True,
+    force: bool = False,
+    timeout: float = SI549_FCAL_TIMEOUT,
+) -> None:
+    """Program several Si549 devices (e.g. Kasli main and helper DCXO) at once.
+
+    FCAL is started on every device that needs it before waiting for any of
+    them, so bring-up takes as long as the slowest calibration rather than
+    the sum of all. Outputs are enabled in one pass once all are done.
+    ``fast`` and ``force`` have the same meaning as in ``Si549.write_config()``.
+    """
+    started = [
+        device
+        for device, config in configs.items()
+        if device.begin_config(*config, fast=fast, force=force)
+    ]
+
+    deadline = time.monotonic() + timeout
+    calibrating = list(started)
+    while calibrating:
+        calibrating = [device for device in calibrating if not device.fcal_done()]
+        if not calibrating:
+            break
+        if time.monotonic() > deadline:
+            raise TimeoutError("Si549 FCAL did not complete")
+        time.sleep(SI549_FCAL_POLL_INTERVAL)
+
+    for device in started:
+        device.end_config()
+
+
+def set_frequencies(frequencies: Dict[Si549, float], **kwargs) -> None:
+    """Tune several Si549 devices at once, see ``write_configs()``."""
+    write_configs(
+        {
+            device: device.compute_config(frequency)
+            for device, frequency in frequencies.items()
+        },
+        **kwargs,
+    )
+
+
+class Si549SweepTable:
+    """Divider configurations for a list of frequencies, computed up front.
+
+    Consecutive entries keep the HSDIV/LSDIV of the entry that starts their
+    run (the one calibrated with FCAL) for as long as the VCO stays in range
+    and within the DCO pull range, so stepping through the table mostly
+    costs FBDIV-only retunes of the bytes that change. Entries starting a
+    run are flagged in ``fcal``. Configurations are kept in compact typed
+    arrays and can be saved to and loaded from a file.
+    """
+
+    _header = struct.Struct("<4sB1sI")  # magic, format version, grade, length
+    _magic = b"S549"
+    _version = 2
+
+    def __init__(self, frequencies: Iterable[float], grade: str = "C") -> None:
+        if grade not in FOUT_RANGE:
+            raise ValueError(f"Unknown Si549 grade: {grade}")
+        self.grade = grade
+        self.frequencies = array("d", frequencies)
+        self.hsdiv = array("H")
+        self.lsdiv = array("B")
+        self.fbdiv = array("Q")
+        # 1 for entries calibrated with FCAL (starting a run), 0 for retunes
+        self.fcal = array("B")
+
+        fvco_min, fvco_max = (Fraction(f) for f in FVCO_RANGE[grade])
+        fosc = Fraction(SI549_FOSC)
+        anchor = None
+        for frequency in self.frequencies:
+            config = None
+            if anchor is not None:
+                # try to stay on the output dividers of the current run
+                fvco = Fraction(frequency) * (anchor.hsdiv << anchor.lsdiv)
+                fbdiv = round(fvco * (1 << FBDIV_FRAC_BITS) / fosc)
+                delta = abs(fbdiv - anchor.fbdiv)
+                if (
+                    fvco_min <= fvco <= fvco_max
+                    and delta * 1_000_000 <= SI549_SMALL_CHANGE_PPM * anchor.fbdiv
+                ):
+                    config = Si549Config(anchor.hsdiv, anchor.lsdiv, fbdiv)
+            self.fcal.append(config is None)
+            if config is None:
+                config = anchor = _solve_config(frequency, grade)
+            self.hsdiv.append(config.hsdiv)
+            self.lsdiv.append(config.lsdiv)
+            self.fbdiv.append(config.fbdiv)
+
+    @classmethod
+    def from_range(
+        cls, start: float, stop: float, step: float, grade: str = "C"
+    ) -> "Si549SweepTable":
+        """Frequencies from ``start`` up to and including ``stop``."""
+        if step == 0:
+            raise ValueError("Step must be non-zero.")
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return cls((start + i * step for i in range(max(count, 0))), grade)
+
+    def __len__(self) -> int:
+        return len(self.frequencies)
+
+    def __getitem__(self, index: int) -> Si549Config:
+        return Si549Config(self.hsdiv[index], self.lsdiv[index], self.fbdiv[index])
+
+    @property
+    def calibrations(self) -> int:
+        """Number of entries requiring a full programming with FCAL when
+        stepping through the table in order - new output dividers or a
+        FBDIV out of the DCO pull range of the run."""
+        return sum(self.fcal)
+
+    def _columns(self) -> Tuple[array, ...]:
+        return (self.frequencies, self.hsdiv, self.lsdiv, self.fbdiv, self.fcal)
+
+    def apply(self, device: Si549, index: int) -> None:
+        """Program ``device`` with the entry at ``index``."""
+        device.write_config(*self[index], fast=True, force=True)
+
+    def sweep(self, device: Si549, start: int = 0) -> Iterator[Tuple[int, float]]:
+        """Step ``device`` through the table, yielding index and frequency
+        after each step."""
+        for index in range(start, len(self)):
+            self.apply(device, index)
+            yield index, self.frequencies[index]
+
+    def save(self, filename: str) -> None:
+        with open(filename, "wb") as f:
+            f.write(
+                self._header.pack(
+                    self._magic, self._version, self.grade.encode(), len(self)
+                )
+            )
+            for column in self._columns():
+                if sys.byteorder != "little":
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                column.tofile(f)
+
+    @classmethod
+    def load(cls, filename: str) -> "Si549SweepTable":
+        with open(filename, "rb") as f:
+            magic, version, grade, length = cls._header.unpack(f.read(cls._header.size))
+            if magic != cls._magic or version != cls._version:
+                raise ValueError("Not a Si549 sweep table file")
+            table = cls.__new__(cls)
+            table.grade = grade.decode()
+            table.frequencies = array("d")
+            table.hsdiv = array("H")
+            table.lsdiv = array("B")
+            table.fbdiv = array("Q")
+            table.fcal = array("B")
+            for column in table._columns():
+                column.fromfile(f, length)
+                if sys.byteorder != "little":
+                    column.byteswap()
+        return table
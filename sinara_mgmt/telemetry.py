@@ -0,0 +1,367 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`telemetry`
+====================================================
+
+Periodic sampling of LM75 temperature sensors into fixed-size ring buffers.
+
+Samples are stored in preallocated ``array`` objects, so memory use does not
+grow with uptime and storing a sample does not allocate. Queries (min, max,
+mean, downsampling) iterate strided ``memoryview`` slices of a single
+channel in place - the two parts of the ring are not concatenated into a
+copy - and filter and aggregate them with C-level builtins (``filterfalse``,
+``min``, ``max``, ``math.fsum``) rather than Python loops over rows.
+
+* Author(s): Jakub Matyas
+"""
+
+import logging
+import math
+import threading
+import time
+from array import array
+from itertools import chain, filterfalse, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from adafruit_bus_device import i2c_device
+
+from sinara_mgmt.chips.lm75 import LM75
+from sinara_mgmt.chips.tca9548a import hold_channel
+
+try:
+    from busio import I2C
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+LM75_ADDRESSES = range(0x48, 0x50)
+
+
+class RingBuffer:
+    """Fixed-capacity ring buffer of timestamped rows with ``channels`` values
+    each. Missing values are stored as NaN and ignored by the statistics.
+    """
+
+    def __init__(self, capacity: int, channels: int = 1, typecode: str = "f") -> None:
+        if capacity <= 0 or channels <= 0:
+            raise ValueError("Capacity and number of channels must be positive.")
+        self.capacity = capacity
+        self.channels = channels
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._nan_row = array(typecode, [math.nan]) * channels
+        self._values = self._nan_row * capacity
+        self._head = 0  # index of the next row to be written
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def next_row(self, timestamp: float) -> int:
+        """Claim the next row for ``timestamp`` and return offset of its first
+        value in the value array. Values of the row are reset to NaN, for the
+        caller to fill in with ``set()``.
+        """
+        row = self._head
+        offset = row * self.channels
+        self._timestamps[row] = timestamp
+        self._values[offset : offset + self.channels] = self._nan_row
+        self._head = (row + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+        return offset
+
+    def set(self, offset: int, value: float) -> None:
+        self._values[offset] = value
+
+    def append(self, timestamp: float, values: Sequence[float]) -> None:
+        if len(values) != self.channels:
+            raise ValueError(f"Expected {self.channels} values.")
+        offset = self.next_row(timestamp)
+        self._values[offset : offset + self.channels] = array(
+            self._values.typecode, values
+        )
+
+    def clear(self) -> None:
+        self._head = 0
+        self._count = 0
+
+    def _rows(self, since: Optional[float] = None) -> List[Tuple[int, int]]:
+        # stored rows (at or after since), oldest first, as at most two
+        # ranges of physical row indices
+        if self._count < self.capacity:
+            ranges = [(0, self._count)]
+        else:
+            ranges = [(self._head, self.capacity), (0, self._head)]
+        if since is None:
+            return ranges
+        skip = _bisect_left(self._timestamps, since, ranges)
+        rows = []
+        for start, end in ranges:
+            if skip < end - start:
+                rows.append((start + skip, end))
+            skip = max(skip - (end - start), 0)
+        return rows
+
+    def _timestamp_segments(self, since: Optional[float] = None) -> List[memoryview]:
+        view = memoryview(self._timestamps)
+        return [view[start:end] for start, end in self._rows(since)]
+
+    def _segments(
+        self, channel: int, since: Optional[float] = None
+    ) -> List[memoryview]:
+        # strided views of channel in the value array - nothing is copied
+        if not 0 <= channel < self.channels:
+            raise IndexError("Channel out of range.")
+        step = self.channels
+        view = memoryview(self._values)
+        return [
+            view[start * step + channel : end * step : step]
+            for start, end in self._rows(since)
+        ]
+
+    def timestamps(self) -> array:
+        """Timestamps of stored rows, oldest first."""
+        return array("d", chain.from_iterable(self._timestamp_segments()))
+
+    def values(self, channel: int = 0) -> array:
+        """Values of ``channel`` in stored rows, oldest first."""
+        return array(
+            self._values.typecode, chain.from_iterable(self._segments(channel))
+        )
+
+    def latest(self, channel: int = 0) -> float:
+        """Value of ``channel`` in the last stored row (NaN if empty)."""
+        if not 0 <= channel < self.channels:
+            raise IndexError("Channel out of range.")
+        if not self._count:
+            return math.nan
+        row = (self._head - 1) % self.capacity
+        return self._values[row * self.channels + channel]
+
+    def window(
+        self, channel: int = 0, since: Optional[float] = None
+    ) -> Tuple[array, array]:
+        """Timestamps and values of ``channel`` recorded at or after ``since``."""
+        return (
+            array("d", chain.from_iterable(self._timestamp_segments(since))),
+            array(
+                self._values.typecode,
+                chain.from_iterable(self._segments(channel, since)),
+            ),
+        )
+
+    def min(self, channel: int = 0, since: Optional[float] = None) -> float:
+        return min(_valid(self._segments(channel, since)), default=math.nan)
+
+    def max(self, channel: int = 0, since: Optional[float] = None) -> float:
+        return max(_valid(self._segments(channel, since)), default=math.nan)
+
+    def mean(self, channel: int = 0, since: Optional[float] = None) -> float:
+        return _mean(self._segments(channel, since))
+
+    def downsample(
+        self, channel: int = 0, factor: int = 10, since: Optional[float] = None
+    ) -> Tuple[array, array]:
+        """Average ``channel`` over consecutive groups of ``factor`` rows.
+
+        Returns timestamps (of the first row in each group) and mean values;
+        a trailing incomplete group is averaged as well.
+        """
+        if factor <= 0:
+            raise ValueError("Downsampling factor must be positive.")
+        timestamps = array(
+            "d",
+            islice(
+                chain.from_iterable(self._timestamp_segments(since)), 0, None, factor
+            ),
+        )
+        values = chain.from_iterable(self._segments(channel, since))
+        means = array("d", (_mean((islice(values, factor),)) for _ in timestamps))
+        return timestamps, means
+
+
+def _valid(segments: Iterable[Iterable[float]]) -> Iterator[float]:
+    # iterated and filtered in C, without copying the segments
+    return filterfalse(math.isnan, chain.from_iterable(segments))
+
+
+def _mean(segments: Iterable[Iterable[float]]) -> float:
+    valid = array("d", _valid(segments))
+    if not valid:
+        return math.nan
+    return math.fsum(valid) / len(valid)
+
+
+def _bisect_left(timestamps: array, value: float, ranges: List[Tuple[int, int]]) -> int:
+    # bisect over the rows in ranges, taken in order as one sequence
+    def timestamp(ix):
+        for start, end in ranges:
+            if ix < end - start:
+                return timestamps[start + ix]
+            ix -= end - start
+
+    lo, hi = 0, sum(end - start for start, end in ranges)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if timestamp(mid) < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def find_lm75(bus: I2C, addresses: Iterable[int] = LM75_ADDRESSES) -> List[LM75]:
+    """Probe ``addresses`` on ``bus`` and return LM75 drivers for those that
+    acknowledge.
+    """
+    sensors = []
+    for address in addresses:
+        try:
+            i2c_device.I2CDevice(bus, address, probe=True)
+        except ValueError:
+            continue
+        sensors.append(LM75(bus, address))
+    return sensors
+
+
+class LM75Sampler:
+    """Sample a set of named LM75 sensors every ``period`` seconds into
+    a ring buffer holding the last ``capacity`` samples of each sensor.
+
+    A failed read is stored as NaN, so one flaky sensor does not stop
+    sampling of the others.
+    """
+
+    def __init__(
+        self,
+        sensors: Dict[str, LM75],
+        period: float = 1.0,
+        capacity: int = 24 * 3600,
+    ) -> None:
+        if not sensors:
+            raise ValueError("No sensors to sample.")
+        self.names = list(sensors)
+        self.sensors = [sensors[name] for name in self.names]
+        self._index = {name: ix for ix, name in enumerate(self.names)}
+        # sensors sharing a (multiplexed) bus are read under a single channel
+        # selection
+        self._groups = {}
+        for ix, sensor in enumerate(self.sensors):
+            self._groups.setdefault(id(sensor.i2c_device.i2c), []).append((ix, sensor))
+        self._groups = list(self._groups.values())
+        self.period = period
+        self.buffer = RingBuffer(capacity, len(self.sensors))
+        self.read_errors = 0
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def from_bus(
+        cls,
+        bus: I2C,
+        addresses: Iterable[int] = LM75_ADDRESSES,
+        prefix: str = "lm75",
+        **kwargs,
+    ) -> "LM75Sampler":
+        """Sample all LM75 sensors found on ``bus`` (e.g. ``KasliDIOT.mon_i2c``),
+        naming them ``<prefix>_0x<address>``.
+        """
+        sensors = {
+            f"{prefix}_0x{sensor.i2c_device.device_address:02x}": sensor
+            for sensor in find_lm75(bus, addresses)
+        }
+        return cls(sensors, **kwargs)
+
+    def sample(self, timestamp: Optional[float] = None) -> None:
+        """Read every sensor once and store the readings as one row.
+
+        The row starts out as NaN, so readings not taken because sampling
+        failed part-way do not leave values of an older row behind.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        offset = self.buffer.next_row(timestamp)
+        for group in self._groups:
+            with hold_channel(group[0][1].i2c_device.i2c):
+                for ix, sensor in group:
+                    try:
+                        value = sensor.temperature
+                    except OSError:
+                        value = math.nan
+                        self.read_errors += 1
+                    self.buffer.set(offset + ix, value)
+
+    def _channel(self, name: str) -> int:
+        try:
+            return self._index[name]
+        except KeyError:
+            raise KeyError(f"Unknown sensor: {name}")
+
+    def latest(self, name: str) -> float:
+        return self.buffer.latest(self._channel(name))
+
+    def window(self, name: str, since: Optional[float] = None) -> Tuple[array, array]:
+        return self.buffer.window(self._channel(name), since)
+
+    def min(self, name: str, since: Optional[float] = None) -> float:
+        return self.buffer.min(self._channel(name), since)
+
+    def max(self, name: str, since: Optional[float] = None) -> float:
+        return self.buffer.max(self._channel(name), since)
+
+    def mean(self, name: str, since: Optional[float] = None) -> float:
+        return self.buffer.mean(self._channel(name), since)
+
+    def downsample(
+        self, name: str, factor: int = 10, since: Optional[float] = None
+    ) -> Tuple[array, array]:
+        return self.buffer.downsample(self._channel(name), factor, since)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            raise RuntimeError("Sampler already running")
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="lm75-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+        # schedule against absolute deadlines so the sampling rate does not
+        # drift by the time spent on the bus
+        deadline = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("LM75 sampling failed")
+            deadline += self.period
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                # overran - skip missed periods instead of bursting
+                deadline -= delay
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def __enter__(self) -> "LM75Sampler":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
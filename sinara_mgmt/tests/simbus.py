@@ -0,0 +1,325 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Simulated Kasli I2C bus and mock EEPROM contents for tests and benchmarks.
+
+``SimBus`` implements the interface of the FTDI I2C interface used by
+``KasliI2C`` (pass it as ``KasliI2C(i2c=...)``) and counts transactions.
+Devices are attached behind the two TCA9548A muxes and answer only while
+their mux channel is selected (and their ``enabled`` condition holds, e.g.
+for devices behind a DIOT slot); any other address is NACKed.
+"""
+
+from typing import Callable, Dict, List, Optional
+
+from sinara_mgmt.si549 import SI549_REGISTER_RESET, SI549_RESET_FCAL
+from sinara_mgmt.sinara import Sinara
+
+# (mux address, channel) of buses as defined in KasliI2C and KasliDIOT
+EEM_CHANNELS = [
+    (0x70, 7),
+    (0x70, 5),
+    (0x70, 4),
+    (0x70, 3),
+    (0x70, 2),
+    (0x70, 1),
+    (0x70, 0),
+    (0x70, 6),
+    (0x71, 4),
+    (0x71, 5),
+    (0x71, 7),
+    (0x71, 6),
+]
+SHARED_CHANNEL = (0x71, 3)
+CPCIS_CHANNEL = (0x71, 5)
+ADAPTER_LOGIC_CHANNEL = (0x71, 6)
+# pins of the DIOT adapter expanders, as in KasliDIOT
+SERVMOD_OFFSET = 1
+EN_I2C0_PIN = 15
+EN_I2C1_PIN = 14
+
+
+# EEPROM contents of the Kasli and of peripherals in mock crates
+KASLI = Sinara(
+    name="Kasli",
+    board=Sinara.boards.index("Kasli"),
+    major=2,
+    minor=0,
+    vendor=Sinara.vendors.index("Technosystem"),
+    eui48=Sinara.parse_eui48("04-91-62-f1-d3-3b"),
+)
+
+BOARDS = ["Urukul", "Sampler", "Zotino", "DIO_BNC", "Fastino", "Urukul"]
+
+
+def mock_board(name, port=0, index=0):
+    return Sinara(
+        name=name,
+        board=Sinara.boards.index(name),
+        major=1,
+        minor=index % 10,
+        port=port,
+        vendor=Sinara.vendors.index("Technosystem"),
+        eui48=bytes([0x54, 0x10, 0xEC, 0, index >> 8, index & 0xFF]),
+    )
+
+
+def mock_crate(eems=12):
+    return [
+        (mock_board(BOARDS[port % len(BOARDS)], index=port), [port])
+        for port in range(eems)
+    ]
+
+
+class RegisterDevice:
+    """Device with a register pointer set by the first written byte and
+    auto-incremented on every access.
+    """
+
+    def __init__(self, size: int = 256, contents: Optional[bytes] = None) -> None:
+        self.registers = bytearray(contents if contents is not None else size)
+        self.pointer = 0
+
+    def _next(self, register: int) -> int:
+        return (register + 1) % len(self.registers)
+
+    def _load(self, register: int) -> int:
+        return self.registers[register]
+
+    def _store(self, register: int, value: int) -> None:
+        self.registers[register] = value
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        self.pointer = data[0] % len(self.registers)
+        for value in data[1:]:
+            self._store(self.pointer, value)
+            self.pointer = self._next(self.pointer)
+
+    def read(self, length: int) -> bytes:
+        data = bytearray()
+        for _ in range(length):
+            data.append(self._load(self.pointer))
+            self.pointer = self._next(self.pointer)
+        return bytes(data)
+
+
+class Si549Sim(RegisterDevice):
+    """Si549 registers; FCAL started by a write of the FCAL bit to the reset
+    register completes immediately and is counted in ``fcals``."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.fcals = 0
+
+    def _store(self, register: int, value: int) -> None:
+        if register == SI549_REGISTER_RESET and value & SI549_RESET_FCAL:
+            self.fcals += 1
+            value &= ~SI549_RESET_FCAL
+        super()._store(register, value)
+
+
+class EEPROMSim(RegisterDevice):
+    """EEPROM NACKing the ``write_cycle`` transactions following a data
+    write, as during its write cycle."""
+
+    def __init__(self, contents: Optional[bytes] = None, write_cycle: int = 3) -> None:
+        super().__init__(contents=contents)
+        self.write_cycle = write_cycle
+        self.busy = 0
+
+    def _access(self) -> None:
+        if self.busy:
+            self.busy -= 1
+            raise OSError("NACK during write cycle")
+
+    def write(self, data: bytes) -> None:
+        self._access()
+        super().write(data)
+        if len(data) > 1:
+            self.busy = self.write_cycle
+
+    def read(self, length: int) -> bytes:
+        self._access()
+        return super().read(length)
+
+
+class PCA9539Sim(RegisterDevice):
+    """PCA9539 with externally driven ``inputs`` (register pairs toggle)."""
+
+    def __init__(self, inputs: int = 0xFFFF) -> None:
+        super().__init__(contents=bytes([0xFF, 0xFF, 0xFF, 0xFF, 0, 0, 0xFF, 0xFF]))
+        self.inputs = inputs
+
+    def _next(self, register: int) -> int:
+        return register ^ 1
+
+    @property
+    def levels(self) -> int:
+        conf = self.registers[6] | (self.registers[7] << 8)
+        output = self.registers[2] | (self.registers[3] << 8)
+        return (self.inputs & conf) | (output & ~conf)
+
+    def driven(self, pin: int) -> Optional[bool]:
+        """Level the expander drives on ``pin``, None if it is an input."""
+        conf = self.registers[6] | (self.registers[7] << 8)
+        if conf & (1 << pin):
+            return None
+        return bool(self.levels & (1 << pin))
+
+    def _load(self, register: int) -> int:
+        if register < 2:
+            return (self.levels >> (8 * register)) & 0xFF
+        return self.registers[register]
+
+    def _store(self, register: int, value: int) -> None:
+        if register >= 2:
+            self.registers[register] = value
+
+
+class SimBus:
+    def __init__(self) -> None:
+        self.muxes = {0x70: 0, 0x71: 0}
+        self.devices = {}
+        self.transactions = 0
+        # devices of adapters inserted into DIOT slots, see insert_diot()
+        self.diot_slots = {}
+
+    def attach(
+        self,
+        device,
+        address: int,
+        channel,
+        enabled: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        """Attach ``device`` answering at ``address`` while ``channel`` is
+        selected and ``enabled()`` (if given) returns True."""
+        channel_devices = self.devices.setdefault(channel, {})
+        channel_devices.setdefault(address, []).append((device, enabled))
+
+    def _device(self, address: int):
+        for mux, selected in self.muxes.items():
+            for channel in range(8):
+                if selected & (1 << channel):
+                    devices = self.devices.get((mux, channel), {}).get(address, [])
+                    for device, enabled in devices:
+                        if enabled is None or enabled():
+                            return device
+        raise OSError(f"NACK from 0x{address:02x}")
+
+    def scan(self, write=False):
+        found = []
+        for address in range(0x79):
+            try:
+                if address in self.muxes or self._device(address):
+                    found.append(address)
+            except OSError:
+                pass
+        return found
+
+    def writeto(self, address, buffer, *, start=0, end=None, stop=True):
+        self.transactions += 1
+        end = end if end else len(buffer)
+        if address in self.muxes:
+            if end > start:
+                self.muxes[address] = buffer[end - 1]
+            return
+        self._device(address).write(bytes(buffer[start:end]))
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None, stop=True):
+        self.transactions += 1
+        end = end if end else len(buffer)
+        if address in self.muxes:
+            buffer[start] = self.muxes[address]
+            return
+        buffer[start:end] = self._device(address).read(end - start)
+
+    def writeto_then_readfrom(
+        self,
+        address,
+        buffer_out,
+        buffer_in,
+        *,
+        out_start=0,
+        out_end=None,
+        in_start=0,
+        in_end=None,
+        stop=False,
+    ):
+        self.transactions += 1
+        out_end = out_end if out_end else len(buffer_out)
+        in_end = in_end if in_end else len(buffer_in)
+        device = self._device(address)
+        device.write(bytes(buffer_out[out_start:out_end]))
+        buffer_in[in_start:in_end] = device.read(in_end - in_start)
+
+
+def kasli_bus(
+    kasli: Sinara, eems: Optional[Dict[int, Sinara]] = None, diot: bool = False
+) -> SimBus:
+    """Simulated bus of a Kasli with EEPROM contents ``kasli`` and
+    peripherals ``eems`` (EEM port - EEPROM contents), optionally with
+    a DIOT adapter.
+    """
+    bus = SimBus()
+    bus.attach(RegisterDevice(22), 0x20, SHARED_CHANNEL)
+    bus.attach(RegisterDevice(22), 0x21, SHARED_CHANNEL)
+    bus.attach(RegisterDevice(contents=kasli.pack()), 0x57, SHARED_CHANNEL)
+    for port, eem in (eems or {}).items():
+        bus.attach(RegisterDevice(contents=eem.pack()), 0x50, EEM_CHANNELS[port])
+    if diot:
+        bus.adapter_expander0 = PCA9539Sim()
+        bus.adapter_expander1 = PCA9539Sim()
+        bus.attach(bus.adapter_expander0, 0x74, ADAPTER_LOGIC_CHANNEL)
+        bus.attach(bus.adapter_expander1, 0x75, ADAPTER_LOGIC_CHANNEL)
+        bus.attach(RegisterDevice(), 0x50, ADAPTER_LOGIC_CHANNEL)
+        bus.attach(RegisterDevice(), 0x57, ADAPTER_LOGIC_CHANNEL)
+    return bus
+
+
+def insert_diot(bus: SimBus, slot: int, eems: List[Optional[Sinara]]) -> None:
+    """Insert an EEM DIOT adapter with peripherals ``eems`` (EEPROM contents
+    on its first and second EEM, None if not connected) into DIOT ``slot``
+    of a ``kasli_bus(..., diot=True)``.
+
+    Devices of the adapter answer on the cPCI-S bus while the slot's servmod
+    line is driven high: its own EEPROM with both EEM I2C enable lines low,
+    the EEPROM of EEM N with only the enable line of EEM N high.
+    """
+    servmod = SERVMOD_OFFSET + slot
+    bus.adapter_expander1.inputs &= ~(1 << servmod)
+    expander0 = bus.adapter_expander0
+
+    def selected(en_i2c0, en_i2c1):
+        def enabled():
+            return (
+                bus.adapter_expander1.driven(servmod) is True
+                and bool(expander0.driven(EN_I2C0_PIN)) is en_i2c0
+                and bool(expander0.driven(EN_I2C1_PIN)) is en_i2c1
+            )
+
+        return enabled
+
+    devices = [(RegisterDevice(), selected(False, False))]
+    for eem_no, eem in enumerate(eems):
+        if eem is not None:
+            enabled = selected(eem_no == 0, eem_no == 1)
+            devices.append((RegisterDevice(contents=eem.pack()), enabled))
+    for device, enabled in devices:
+        bus.attach(device, 0x50, CPCIS_CHANNEL, enabled)
+    bus.diot_slots[slot] = devices
+
+
+def remove_diot(bus: SimBus, slot: int) -> None:
+    """Remove the adapter inserted into DIOT ``slot`` by ``insert_diot()``."""
+    bus.adapter_expander1.inputs |= 1 << (SERVMOD_OFFSET + slot)
+    attached = bus.devices[CPCIS_CHANNEL][0x50]
+    for device in bus.diot_slots.pop(slot):
+        attached.remove(device)
+
+
+def populated_bus() -> SimBus:
+    """Simulated bus of ``KASLI`` with the first six boards of a mock crate."""
+    return kasli_bus(KASLI, {port: dev for dev, (port,) in mock_crate(6)})
@@ -0,0 +1,60 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""asyncio front-end on the simulated bus from ``simbus``."""
+
+import asyncio
+import threading
+
+import pytest
+
+from sinara_mgmt.aio import AsyncKasli
+from sinara_mgmt.kasli import KasliI2C
+from sinara_mgmt.tests.simbus import KASLI, kasli_bus, mock_board
+
+
+def test_wrappers_share_bus_executor():
+    async def main():
+        board = mock_board("Fastino", index=9)
+        kasli = KasliI2C(i2c=kasli_bus(KASLI, {4: board}))
+        first, second = AsyncKasli(kasli), AsyncKasli(kasli)
+        assert first._executor is second._executor
+        executor = first._executor
+
+        ((dev, slot),) = await first.discover_peripherals()
+        assert (dev.name_fmt, slot) == (board.name_fmt, 4)
+        await first.close()
+        assert (await second.sfp_status(0)) is not None
+        await second.close()
+        with pytest.raises(RuntimeError):
+            executor.submit(int)
+
+    asyncio.run(main())
+
+
+class _SlowKasli(KasliI2C):
+    # construction blocks until released; records close()
+    release = threading.Event()
+    closed = threading.Event()
+
+    def __init__(self, **kwargs):
+        self.release.wait(1)
+        super().__init__(**kwargs)
+
+    def close(self):
+        self.closed.set()
+
+
+def test_cancelled_open_closes_kasli():
+    async def main():
+        task = asyncio.create_task(AsyncKasli.open(_SlowKasli, i2c=kasli_bus(KASLI)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        _SlowKasli.release.set()
+        loop = asyncio.get_running_loop()
+        assert await loop.run_in_executor(None, _SlowKasli.closed.wait, 1)
+
+    asyncio.run(main())
@@ -0,0 +1,197 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Benchmarks of EEPROM (un)packing, description generation and discovery.
+
+Bus-level benchmarks run against the simulated bus from ``simbus`` and
+report I2C transaction counts next to wall time. Transaction counts are
+compared with ``benchmark_baselines.json`` - a change that adds bus
+transactions fails the run; wall times depend on the machine and are only
+reported, never stored.
+
+Run ``python -m sinara_mgmt.tests.test_benchmarks`` to print the results
+and ``... --update`` to store their transaction counts as the new
+baselines.
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+from sinara_mgmt.description_manager import SystemDescription
+from sinara_mgmt.kasli import KasliI2C
+from sinara_mgmt.kasli_diot import KasliDIOT
+from sinara_mgmt.sinara import Sinara
+from sinara_mgmt.tests.simbus import (
+    BOARDS,
+    KASLI,
+    insert_diot,
+    kasli_bus,
+    mock_board,
+    mock_crate,
+    populated_bus,
+)
+
+BASELINES = Path(__file__).with_name("benchmark_baselines.json")
+
+
+def timed(func, repeat=1):
+    """Best wall time (in seconds) of ``repeat`` calls of ``func``, taken over
+    three rounds, and the last result.
+    """
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best, result
+
+
+def bench_sinara_pack():
+    boards = [mock_board(BOARDS[i % len(BOARDS)], index=i) for i in range(1000)]
+    wall, _ = timed(lambda: [board.pack() for board in boards])
+    return {"wall": wall, "per_second": len(boards) / wall}
+
+
+def bench_sinara_unpack():
+    images = [mock_board(BOARDS[i % len(BOARDS)], index=i).pack() for i in range(1000)]
+    wall, _ = timed(lambda: [Sinara.unpack(image) for image in images])
+    return {"wall": wall, "per_second": len(images) / wall}
+
+
+def _describe(devs):
+    description = SystemDescription(KASLI, devs)
+    description.gen_system_description()
+    return description.description
+
+
+def bench_description_crate():
+    devs = mock_crate()
+    wall, _ = timed(lambda: _describe(devs), repeat=100)
+    return {"wall": wall}
+
+
+def bench_description_fleet():
+    fleet = [mock_crate() for _ in range(100)]
+    wall, _ = timed(lambda: [_describe(devs) for devs in fleet])
+    return {"wall": wall}
+
+
+def _bus_benchmark(make_bus, kasli_cls, operation):
+    # transactions of the constructor (if operation is None) or of the
+    # operation are counted on a fresh bus for every round
+    def run():
+        bus = make_bus()
+        kasli = kasli_cls(i2c=bus)
+        if operation is None:
+            return bus.transactions
+        before = bus.transactions
+        operation(kasli)
+        return bus.transactions - before
+
+    wall, transactions = timed(run)
+    return {"wall": wall, "transactions": transactions}
+
+
+def bench_kasli_init():
+    return _bus_benchmark(populated_bus, KasliI2C, None)
+
+
+def bench_kasli_discovery():
+    return _bus_benchmark(
+        populated_bus, KasliI2C, lambda kasli: kasli.discover_peripherals()
+    )
+
+
+def bench_diot_init():
+    return _bus_benchmark(lambda: kasli_bus(KASLI, diot=True), KasliDIOT, None)
+
+
+def bench_diot_discovery():
+    # all DIOT slots empty - presence detection only
+    return _bus_benchmark(
+        lambda: kasli_bus(KASLI, diot=True),
+        KasliDIOT,
+        lambda kasli: kasli.discover_peripherals(),
+    )
+
+
+def _occupied_diot_bus():
+    bus = kasli_bus(KASLI, diot=True)
+    # adapters with two EEMs, one EEM and none connected
+    insert_diot(bus, 0, [mock_board("Urukul", index=1), mock_board("Sampler", index=2)])
+    insert_diot(bus, 3, [mock_board("Zotino", index=3), None])
+    insert_diot(bus, 6, [None, None])
+    return bus
+
+
+def bench_diot_discovery_occupied():
+    return _bus_benchmark(
+        _occupied_diot_bus, KasliDIOT, lambda kasli: kasli.discover_peripherals()
+    )
+
+
+BENCHMARKS = {
+    name[len("bench_") :]: func
+    for name, func in list(globals().items())
+    if name.startswith("bench_")
+}
+
+
+def load_baselines():
+    with open(BASELINES) as f:
+        return json.load(f)
+
+
+def check_transactions(name, result):
+    baseline = load_baselines()[name]
+    assert result["transactions"] <= baseline, (
+        f"{name}: {result['transactions']} I2C transactions, " f"baseline is {baseline}"
+    )
+
+
+def test_sinara_pack_unpack():
+    for name in ("sinara_pack", "sinara_unpack"):
+        assert BENCHMARKS[name]()["per_second"] > 0
+
+
+def test_description_generation():
+    for name in ("description_crate", "description_fleet"):
+        assert BENCHMARKS[name]()["wall"] > 0
+
+
+def test_kasli_transactions():
+    for name in ("kasli_init", "kasli_discovery"):
+        check_transactions(name, BENCHMARKS[name]())
+
+
+def test_diot_transactions():
+    for name in ("diot_init", "diot_discovery", "diot_discovery_occupied"):
+        check_transactions(name, BENCHMARKS[name]())
+
+
+def main(update=False):
+    results = {name: func() for name, func in BENCHMARKS.items()}
+    for name, result in results.items():
+        line = f"{name:24s} {result['wall'] * 1e3:10.3f} ms"
+        if "transactions" in result:
+            line += f" {result['transactions']:6d} transactions"
+        if "per_second" in result:
+            line += f" {result['per_second']:12.0f} /s"
+        print(line)
+    if update:
+        with open(BASELINES, "w") as f:
+            baselines = {
+                name: result["transactions"]
+                for name, result in results.items()
+                if "transactions" in result
+            }
+            json.dump(baselines, f, indent=4, sort_keys=True)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main(update="--update" in sys.argv[1:])
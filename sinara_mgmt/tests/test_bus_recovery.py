@@ -0,0 +1,69 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Stuck bus recovery on the simulated bus from ``simbus``, with the FTDI
+bus state and the mux reset pin faked."""
+
+import sinara_mgmt.kasli
+from sinara_mgmt.chips.eeprom_24aa025e48 import EEPROM24AA02E48
+from sinara_mgmt.kasli import KasliI2C
+from sinara_mgmt.tests.simbus import KASLI, kasli_bus, mock_board
+
+
+class _MuxReset:
+    # resetting the muxes deselects all their channels
+    def __init__(self, bus):
+        self.bus = bus
+
+    def value(self, level):
+        if level:
+            self.bus.muxes = dict.fromkeys(self.bus.muxes, 0)
+
+
+def _stuck_kasli(monkeypatch, board):
+    bus = kasli_bus(KASLI, {3: board})
+    kasli = KasliI2C(i2c=bus)
+    kasli.mux_reset = _MuxReset(bus)
+    state = {"stuck": False, "faults": 1}
+
+    read = bus.writeto_then_readfrom
+
+    def writeto_then_readfrom(address, *args, **kwargs):
+        if address == 0x50 and state["faults"]:
+            # a slave interrupted mid-transfer keeps SDA low
+            state["faults"] -= 1
+            state["stuck"] = True
+            raise OSError("I2C bus stuck")
+        return read(address, *args, **kwargs)
+
+    bus.writeto_then_readfrom = writeto_then_readfrom
+    monkeypatch.setattr(sinara_mgmt.kasli, "find_controller", lambda i2c: bus)
+    monkeypatch.setattr(sinara_mgmt.kasli, "sda_low", lambda c: state["stuck"])
+    monkeypatch.setattr(
+        sinara_mgmt.kasli, "clock_out", lambda c: state.update(stuck=False)
+    )
+    return bus, kasli
+
+
+def test_channel_op_retried_on_its_channel(monkeypatch):
+    board = mock_board("Urukul", index=4)
+    bus, kasli = _stuck_kasli(monkeypatch, board)
+    eeprom = EEPROM24AA02E48(kasli.bus_eem[3], address=0x50, probe=False)
+
+    assert eeprom.read(0, 16) == board.pack()[:16]
+    assert kasli.bus_recoveries == 1
+    assert bus.muxes == {0x70: 0, 0x71: 0}
+    assert kasli.tca0.selection is None
+
+
+def test_held_channel_restored(monkeypatch):
+    board = mock_board("Sampler", index=5)
+    bus, kasli = _stuck_kasli(monkeypatch, board)
+    eeprom = EEPROM24AA02E48(kasli.bus_eem[3], address=0x50, probe=False)
+
+    with kasli.bus_eem[3].selected():
+        assert eeprom.read(0, 16) == board.pack()[:16]
+        assert bus.muxes[0x70] == kasli.bus_eem[3].channel_switch[0]
+    assert kasli.bus_recoveries == 1
+    assert bus.muxes == {0x70: 0, 0x71: 0}
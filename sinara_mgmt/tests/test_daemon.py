@@ -0,0 +1,59 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Management daemon socket handling and crate caches on the simulated bus
+from ``simbus``."""
+
+import os
+import socket
+import stat
+
+import pytest
+
+from sinara_mgmt.daemon import CrateCache, DaemonClient, ManagementDaemon
+from sinara_mgmt.kasli import KasliI2C
+from sinara_mgmt.kasli_diot import KasliDIOT
+from sinara_mgmt.tests.simbus import KASLI, insert_diot, kasli_bus, mock_board
+
+
+def test_socket_owner_only_and_single_daemon(tmp_path):
+    path = str(tmp_path / "sinara-mgmt.sock")
+    with ManagementDaemon({}, path):
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        with DaemonClient(path) as client:
+            assert client.query() == {"crates": []}
+        with pytest.raises(RuntimeError):
+            ManagementDaemon({}, path).start()
+    assert not os.path.exists(path)
+
+
+def test_stale_socket_replaced(tmp_path):
+    path = str(tmp_path / "sinara-mgmt.sock")
+    # bound but never listened on, as left behind by a killed daemon
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(path)
+    with ManagementDaemon({}, path):
+        with DaemonClient(path) as client:
+            assert client.query() == {"crates": []}
+
+
+def test_diot_slots_polled_incrementally():
+    bus = kasli_bus(KASLI, diot=True)
+    crate = CrateCache(KasliDIOT(i2c=bus))
+    insert_diot(bus, 2, [mock_board("Urukul", index=1), None])
+    peripheral = crate.refresh("diot_peripherals").value[2]
+    assert peripheral["device"]["board"] == "Urukul"
+    assert peripheral["ports"] == [4]
+
+    # unchanged slots are not identified again
+    before = bus.transactions
+    assert crate.refresh("diot_peripherals").value[2] == peripheral
+    assert bus.transactions - before == crate.cost("diot_peripherals")
+
+
+def test_unknown_ids_reported_as_error():
+    crate = CrateCache(KasliI2C(i2c=kasli_bus(KASLI._replace(vendor=42))))
+    cached = crate.refresh("sinara_eeprom")
+    assert cached.value is None
+    assert cached.error is not None
@@ -65,9 +65,8 @@ def main_diot():
     dev_names = ["Zotino", "DIO_BNC", "Sampler", "Stabilizer", "Fastino"]
     devs = generate_mock_boards(dev_names)
     _i2c_bus = Mock()
-    _en_i2c0 = Mock()
-    _en_i2c1 = Mock()
-    diot_devices = [EemDiotAdapter(_i2c_bus, _en_i2c0, _en_i2c1) for i in range(8)]
+    _en_i2c = Mock()
+    diot_devices = [EemDiotAdapter(_i2c_bus, _en_i2c) for i in range(8)]
     board_index = 0
 
     for ix, eem_diot_adapter in enumerate(diot_devices):
@@ -0,0 +1,69 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""DIOT hot-plug watcher on the simulated bus from ``simbus``."""
+
+import digitalio
+
+from sinara_mgmt.diot_hotplug import FAILED, INSERTED, REMOVED, DiotHotplugWatcher
+from sinara_mgmt.kasli_diot import KasliDIOT
+from sinara_mgmt.tests.simbus import (
+    KASLI,
+    insert_diot,
+    kasli_bus,
+    mock_board,
+    remove_diot,
+)
+
+
+def _diot():
+    bus = kasli_bus(KASLI, diot=True)
+    return bus, KasliDIOT(i2c=bus)
+
+
+def test_occupied_slot():
+    bus, kasli = _diot()
+    watcher = DiotHotplugWatcher(kasli)
+    assert watcher.poll() == []
+
+    insert_diot(bus, 2, [mock_board("Urukul", index=1), mock_board("Sampler", index=2)])
+    (event,) = watcher.poll()
+    assert (event.kind, event.slot) == (INSERTED, 2)
+    adapter, ports = event.peripheral
+    assert ports == [4, 5]
+    assert [eem.board_fmt for eem in adapter.identified_eems] == ["Urukul", "Sampler"]
+    assert kasli.diot_peripherals[2] == event.peripheral
+    # the servmod line is released, the enable lines stay driven by the adapter
+    assert bus.adapter_expander1.driven(3) is None
+    assert kasli.en_i2c.direction == digitalio.Direction.OUTPUT
+    assert watcher.poll() == []
+
+    remove_diot(bus, 2)
+    (event,) = watcher.poll()
+    assert (event.kind, event.slot) == (REMOVED, 2)
+    assert kasli.diot_peripherals[2] is None
+    assert kasli.en_i2c.direction == digitalio.Direction.INPUT
+
+
+def test_unidentified_slot_reported_once():
+    bus, kasli = _diot()
+    watcher = DiotHotplugWatcher(kasli)
+
+    insert_diot(bus, 5, [mock_board("Zotino", index=3), None])
+    eem_eeprom = bus.diot_slots[5][1][0]
+    eem_eeprom.registers[4:6] = bytes(2)  # invalid magic
+    (event,) = watcher.poll()
+    assert (event.kind, event.slot) == (FAILED, 5)
+    assert isinstance(event.peripheral, ValueError)
+    assert kasli.diot_peripherals[5] is None
+    assert kasli.en_i2c.direction == digitalio.Direction.INPUT
+    # not retried until reinserted
+    assert watcher.poll() == []
+
+    remove_diot(bus, 5)
+    (event,) = watcher.poll()
+    assert (event.kind, event.slot, event.peripheral) == (REMOVED, 5, None)
+    insert_diot(bus, 5, [mock_board("Zotino", index=3), None])
+    (event,) = watcher.poll()
+    assert (event.kind, event.slot) == (INSERTED, 5)
@@ -0,0 +1,40 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""EEPROM programming on the simulated bus from ``simbus``."""
+
+import pytest
+
+from sinara_mgmt.chips.eeprom_24aa025e48 import EEPROM24AA02E48
+from sinara_mgmt.kasli import KasliI2C
+from sinara_mgmt.tests.simbus import (
+    EEM_CHANNELS,
+    KASLI,
+    EEPROMSim,
+    kasli_bus,
+    mock_board,
+)
+
+
+def _eeprom(write_cycle):
+    bus = kasli_bus(KASLI)
+    sim = EEPROMSim(write_cycle=write_cycle)
+    bus.attach(sim, 0x50, EEM_CHANNELS[2])
+    kasli = KasliI2C(i2c=bus)
+    return sim, EEPROM24AA02E48(kasli.bus_eem[2], address=0x50)
+
+
+def test_program_waits_for_write_cycles():
+    contents = mock_board("Zotino", index=4).pack()
+    sim, eeprom = _eeprom(write_cycle=3)
+    eeprom.contents = list(contents)
+    assert bytes(sim.registers) == contents
+    assert bytes(eeprom.contents) == contents
+
+
+def test_program_times_out(monkeypatch):
+    monkeypatch.setattr(EEPROM24AA02E48, "WRITE_TIMEOUT", 0.01)
+    sim, eeprom = _eeprom(write_cycle=10**9)
+    with pytest.raises(TimeoutError):
+        eeprom.contents = [0] * 8
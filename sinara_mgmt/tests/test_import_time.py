@@ -0,0 +1,60 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+import subprocess
+import sys
+
+# modules that must only be imported by commands accessing hardware
+HARDWARE_MODULES = ("adafruit_blinka", "busio", "digitalio", "pyftdi", "usb")
+
+# generous upper bound of the cumulative import time of the CLI module
+CLI_IMPORT_BUDGET_US = 200_000
+
+
+def import_time(module):
+    """Import ``module`` in a fresh interpreter and return its cumulative
+    import time (in microseconds) and the names of all imported modules.
+    """
+    out = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys, {module}; print(*sys.modules)",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    cumulative = None
+    for line in out.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1])
+    return cumulative, out.stdout.split()
+
+
+def test_offline_imports_skip_hardware():
+    for module in (
+        "sinara_mgmt.cli",
+        "sinara_mgmt.sinara",
+        "sinara_mgmt.description_manager",
+    ):
+        _, modules = import_time(module)
+        loaded = [m for m in modules if m.split(".")[0] in HARDWARE_MODULES]
+        assert not loaded, f"{module} imports hardware modules: {loaded}"
+
+
+def test_cli_import_time():
+    cumulative, _ = import_time("sinara_mgmt.cli")
+    assert cumulative is not None
+    assert cumulative < CLI_IMPORT_BUDGET_US, f"import took {cumulative} us"
+
+
+if __name__ == "__main__":
+    test_offline_imports_skip_hardware()
+    test_cli_import_time()
+    print(f"sinara_mgmt.cli imported in {import_time('sinara_mgmt.cli')[0]} us")
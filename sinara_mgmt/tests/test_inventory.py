@@ -0,0 +1,41 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Recording discovery results in the board inventory."""
+
+from sinara_mgmt.inventory import Inventory
+from sinara_mgmt.tests.simbus import mock_board
+
+CRATE = "54-10-ec-00-00-ff"
+
+
+def test_unknown_ids_recorded_raw():
+    future = mock_board("Urukul", index=1)._replace(board=99, vendor=42)
+    known = mock_board("Sampler", index=2)
+    with Inventory() as inventory:
+        inventory.record(CRATE, [(future, 0), (known, 1)])
+        record = inventory.locate(future.eui48_fmt)
+        assert (record.board, record.variant, record.vendor) == ("99", "0", "42")
+        assert inventory.locate(known.eui48_fmt).board == "Sampler"
+
+
+def test_moves_recorded():
+    first, second = mock_board("Urukul", index=1), mock_board("Sampler", index=2)
+    other = "54-10-ec-00-00-fe"
+    with Inventory() as inventory:
+        assert inventory.record(CRATE, [(first, 0), (second, [1])], timestamp=1) == []
+        # same location - not a move
+        assert inventory.record(CRATE, [(first, 0), (second, 1)], timestamp=2) == []
+
+        (move,) = inventory.record(CRATE, [(first, 2)], timestamp=3)
+        assert move == (first.eui48_fmt, 3, CRATE, 0, CRATE, 2)
+        assert not inventory.locate(second.eui48_fmt).present
+
+        (move,) = inventory.record(other, [(second, [4, 5])], timestamp=4)
+        assert move == (second.eui48_fmt, 4, CRATE, 1, other, 4)
+        assert inventory.moves(second.eui48_fmt) == [move]
+        assert len(inventory.moves()) == 2
+        record = inventory.locate(second.eui48_fmt)
+        assert (record.crate, record.slot, record.present) == (other, 4, True)
+        assert (record.first_seen, record.last_seen) == (1, 4)
@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Deferred EEPROM reads of discovered boards on the simulated bus."""
+
+from sinara_mgmt.kasli import KasliI2C
+from sinara_mgmt.kasli_diot import KasliDIOT
+from sinara_mgmt.tests.simbus import KASLI, insert_diot, kasli_bus, mock_board
+
+
+def test_body_read_once():
+    board = mock_board("Urukul", index=7)
+    bus = kasli_bus(KASLI, {3: board})
+    kasli = KasliI2C(i2c=bus)
+    kasli.discover_peripherals()
+    ((dev, slot),) = kasli.eem_peripherals
+    assert slot == 3
+
+    before = bus.transactions
+    # header fields and the EUI-48 are read during discovery
+    assert (dev.name_fmt, dev.eui48_fmt) == (board.name_fmt, board.eui48_fmt)
+    assert bus.transactions == before
+    assert not dev.loaded
+
+    assert dev.load() == board
+    assert dev.vendor_data == board.vendor_data
+    assert dev.load(check=False) == board
+    # mux select, body read, mux release
+    assert bus.transactions == before + 3
+
+
+def test_diot_body_read_attaches_slot():
+    board = mock_board("Sampler", index=5)
+    bus = kasli_bus(KASLI, diot=True)
+    insert_diot(bus, 4, [board, None])
+    kasli = KasliDIOT(i2c=bus)
+    kasli.discover_peripherals()
+    dev = kasli.diot_peripherals[4][0].device
+
+    assert dev.load() == board
+    assert bus.adapter_expander1.driven(5) is None
+
+
+def test_identify_reads_eui48_and_header_at_once():
+    board = mock_board("Zotino", index=9)
+    bus = kasli_bus(KASLI, {6: board})
+    kasli = KasliI2C(i2c=bus)
+
+    before = bus.transactions
+    dev = kasli.identify_eem(kasli.bus_eem[6])
+    # probe and a single read rolling over from the EUI-48 to the header,
+    # each with mux select and release
+    assert bus.transactions - before == 6
+    assert (dev.name_fmt, dev.eui48_fmt) == (board.name_fmt, board.eui48_fmt)
+    assert dev.load() == board
@@ -0,0 +1,41 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Batched transactions on the simulated bus from ``simbus``."""
+
+import threading
+
+from sinara_mgmt.kasli import KasliI2C
+from sinara_mgmt.tests.simbus import KASLI, kasli_bus
+
+
+def _locked_elsewhere(kasli):
+    result = []
+
+    def try_lock():
+        result.append(kasli.try_lock())
+        if result[0]:
+            kasli.unlock()
+
+    thread = threading.Thread(target=try_lock)
+    thread.start()
+    thread.join(1)
+    return not result[0]
+
+
+def test_batch_holds_bus_lock():
+    kasli = KasliI2C(i2c=kasli_bus(KASLI))
+    with kasli.batch() as batch:
+        assert _locked_elsewhere(kasli)
+        read = kasli.queue_on_channel(
+            batch, kasli.bus_shared, lambda: batch.write_read(0x57, b"\x00", 4)
+        )
+        probe = kasli.queue_on_channel(
+            batch, kasli.bus_eem[0], lambda: batch.write(0x50)
+        )
+        kasli._execute(batch)
+        assert _locked_elsewhere(kasli)
+    assert not _locked_elsewhere(kasli)
+    assert bytes(read.result()) == KASLI.pack()[:4]
+    assert not probe.ok
@@ -0,0 +1,74 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Task selection and running of ``PollScheduler`` without a bus."""
+
+import threading
+
+from sinara_mgmt.scheduler import PollScheduler, PollTask
+
+
+def _scheduler():
+    # 100 transactions of credit at 1 ms per transaction
+    return PollScheduler(threading.RLock(), budget=0.1, transaction_time=1e-3)
+
+
+def _task(name, cost, priority=0, calls=None):
+    return PollTask(
+        name,
+        lambda: calls.append(name) if calls is not None else None,
+        1.0,
+        priority=priority,
+        cost=cost,
+    )
+
+
+def test_select_within_credit():
+    scheduler = _scheduler()
+    first, second = _task("first", 60, priority=1), _task("second", 60)
+    assert scheduler._select([first, second]) == [first]
+
+    # a task over the whole capacity only runs at full credit
+    big = _task("big", 500)
+    assert scheduler._select([big, first]) == [big]
+    scheduler._credit = 0.05
+    assert scheduler._select([big, first]) == []
+
+
+def test_select_commands_regardless_of_credit():
+    scheduler = _scheduler()
+    scheduler._credit = 0.0
+    command = PollTask("command", lambda: None, None, cost=500)
+    polled = _task("polled", 1)
+    assert scheduler._select([command, polled]) == [command]
+
+
+def test_run_pending():
+    scheduler = _scheduler()
+    calls = []
+    scheduler.add(_task("low", 10, calls=calls))
+    scheduler.add(_task("high", 10, priority=1, calls=calls))
+    scheduler.add(_task("later", 10, calls=calls), delay=60.0)
+    future = scheduler.submit(lambda: calls.append("command") or 42, cost=10)
+
+    assert scheduler.run_pending() == ["command", "high", "low"]
+    assert calls == ["command", "high", "low"]
+    assert future.result(0) == 42
+    assert scheduler._credit < scheduler.capacity
+    stats = scheduler.stats()
+    assert (stats["high"].runs, stats["later"].runs) == (1, 0)
+    # periodic tasks are due again only after their period
+    assert scheduler.run_pending() == []
+
+
+def test_commands_behind_unaffordable_task_run():
+    scheduler = _scheduler()
+    scheduler._credit = 0.0
+    scheduler.add(_task("expensive", 1000, priority=5))
+    scheduler.add(_task("cheap", 1))
+    future = scheduler.submit(lambda: 42, priority=1)
+
+    assert scheduler.run_pending() == ["command"]
+    assert future.result(0) == 42
+    assert not scheduler._commands
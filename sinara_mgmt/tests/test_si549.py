@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Si549 programming on the simulated bus from ``simbus``."""
+
+import pytest
+
+from sinara_mgmt.kasli import KasliI2C
+from sinara_mgmt.si549 import (
+    FVCO_RANGE,
+    HSDIV_RANGE,
+    SI549_DEFAULT_ADDRESS,
+    SI549_REGISTER_FBDIV_0,
+    SI549_REGISTER_HSDIV,
+    SI549_REGISTER_OUTPUT_EN,
+    Si549,
+    Si549SweepTable,
+    _encode_dividers,
+    config_frequency,
+    solve_config,
+)
+from sinara_mgmt.tests.simbus import EEM_CHANNELS, KASLI, Si549Sim, kasli_bus
+
+
+def _programmed_si549(frequency):
+    # Si549 already running frequency, e.g. programmed by an earlier process
+    config = solve_config(frequency)
+    device = Si549Sim()
+    device.registers[SI549_REGISTER_HSDIV : SI549_REGISTER_HSDIV + 2] = bytes(
+        _encode_dividers(config.hsdiv, config.lsdiv)
+    )
+    device.registers[
+        SI549_REGISTER_FBDIV_0 : SI549_REGISTER_FBDIV_0 + 6
+    ] = config.fbdiv.to_bytes(6, "little")
+    device.registers[SI549_REGISTER_OUTPUT_EN] = 1
+    bus = kasli_bus(KASLI)
+    bus.attach(device, SI549_DEFAULT_ADDRESS, EEM_CHANNELS[1])
+    kasli = KasliI2C(i2c=bus)
+    return bus, device, Si549(kasli.bus_eem[1])
+
+
+@pytest.mark.parametrize("frequency", [0.2e6, 10e6, 100e6, 156.25e6, 325e6])
+def test_solve_config(frequency):
+    config = solve_config(frequency)
+    assert config.hsdiv in HSDIV_RANGE
+    assert config.hsdiv % 2 == 0 or (config.hsdiv <= 33 and config.lsdiv == 0)
+    fvco = frequency * (config.hsdiv << config.lsdiv)
+    fvco_min, fvco_max = FVCO_RANGE["C"]
+    assert fvco_min <= fvco <= fvco_max
+    # FBDIV has 32 fractional bits - well below 1 ppb of error
+    assert config_frequency(config) == pytest.approx(frequency, rel=1e-9)
+
+
+def test_solve_config_out_of_range():
+    with pytest.raises(ValueError):
+        solve_config(400e6)
+    assert solve_config(400e6, grade="B").lsdiv == 0
+
+
+def test_skipped_programming_is_not_a_calibration_point():
+    bus, device, si549 = _programmed_si549(100e6)
+    si549.set_frequency(100e6)
+    assert si549.skipped_programmings == 1
+    assert device.fcals == 0
+
+    # the device may have been retuned away from its FCAL point by an earlier
+    # process - the first change is calibrated
+    si549.set_frequency(100.01e6)
+    assert device.fcals == 1
+
+    before = bus.transactions
+    si549.set_frequency(100.02e6)
+    # FBDIV-only retune: mux select, FBDIV burst, mux release
+    assert bus.transactions - before == 3
+    assert device.fcals == 1
+    assert device.registers[SI549_REGISTER_OUTPUT_EN] == 1
+    fbdiv = device.registers[SI549_REGISTER_FBDIV_0 : SI549_REGISTER_FBDIV_0 + 6]
+    assert int.from_bytes(fbdiv, "little") == solve_config(100.02e6).fbdiv
+
+
+def test_sweep_table_does_not_evict_cached_solutions():
+    solve_config.cache_clear()
+    solve_config(100e6)
+    table = Si549SweepTable.from_range(50e6, 300e6, 0.5e6)
+    assert len(table) == 501
+    assert solve_config.cache_info().currsize == 1
+
+
+def test_sweep_calibrations_match_fcals(tmp_path):
+    # runs are broken by the DCO pull range, not by output divider changes
+    table = Si549SweepTable.from_range(100e6, 101e6, 10e3)
+    assert len({(config.hsdiv, config.lsdiv) for config in table}) == 1
+    bus = kasli_bus(KASLI)
+    device = Si549Sim()
+    bus.attach(device, SI549_DEFAULT_ADDRESS, EEM_CHANNELS[1])
+    si549 = Si549(KasliI2C(i2c=bus).bus_eem[1])
+
+    for _ in table.sweep(si549):
+        pass
+    assert table.calibrations == device.fcals > 1
+
+    table.save(str(tmp_path / "sweep.bin"))
+    loaded = Si549SweepTable.load(str(tmp_path / "sweep.bin"))
+    assert list(loaded) == list(table)
+    assert loaded.calibrations == table.calibrations
@@ -0,0 +1,30 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Multiplexer channel holding on the simulated bus from ``simbus``."""
+
+import threading
+
+from sinara_mgmt.kasli import KasliI2C
+from sinara_mgmt.tests.simbus import KASLI, kasli_bus
+
+
+def test_held_channel_excludes_other_threads():
+    kasli = KasliI2C(i2c=kasli_bus(KASLI))
+    done = threading.Event()
+
+    def read_expander():
+        kasli.expander0.gpio
+        done.set()
+
+    thread = threading.Thread(target=read_expander)
+    with kasli.bus_shared.selected():
+        # the holding thread itself still accesses devices on the channel
+        kasli.expander1.gpio
+        thread.start()
+        assert not done.wait(0.05)
+        assert kasli.tca1.held is kasli.bus_shared
+    thread.join(1)
+    assert done.is_set()
+    assert kasli.tca1.held is None
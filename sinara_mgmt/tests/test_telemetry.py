@@ -0,0 +1,53 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""Ring buffer statistics and LM75 sampling."""
+
+import math
+from array import array
+from types import SimpleNamespace
+
+import pytest
+
+from sinara_mgmt.telemetry import LM75Sampler, RingBuffer
+
+
+def test_ring_buffer_wraps():
+    buffer = RingBuffer(4, channels=2)
+    for t in range(6):
+        buffer.append(float(t), [t, math.nan if t == 4 else -t])
+    assert list(buffer.timestamps()) == [2.0, 3.0, 4.0, 5.0]
+    assert list(buffer.values(0)) == [2.0, 3.0, 4.0, 5.0]
+    assert buffer.latest(1) == -5.0
+    assert (buffer.min(1), buffer.max(1)) == (-5.0, -2.0)
+    assert buffer.mean(1) == pytest.approx(-10 / 3)
+    assert buffer.mean(0, since=3.5) == 4.5
+    assert buffer.downsample(0, factor=3) == (
+        array("d", [2.0, 5.0]),
+        array("d", [3.0, 5.0]),
+    )
+
+
+class _Sensor:
+    def __init__(self, value):
+        self.i2c_device = SimpleNamespace(i2c=None)
+        self.value = value
+
+    @property
+    def temperature(self):
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+
+def test_failed_sample_leaves_nan():
+    sensors = {"a": _Sensor(20.0), "b": _Sensor(30.0)}
+    sampler = LM75Sampler(sensors, capacity=1)
+    sampler.sample(1.0)
+    sensors["a"].value = RuntimeError("sensor gone")
+    with pytest.raises(RuntimeError):
+        sampler.sample(2.0)
+    assert math.isnan(sampler.latest("a"))
+    # the old reading of b is not taken for the new row
+    assert math.isnan(sampler.latest("b"))
@@ -0,0 +1,290 @@
+# SPDX-FileCopyrightText: 2023 Jakub Matyas for Warsaw University of Technology
+#
+# SPDX-License-Identifier: MIT
+
+"""
+`trace`
+====================================================
+
+Recording and replay of I2C transaction traces.
+
+``RecordingI2C`` wraps the FTDI I2C interface used by ``KasliI2C`` and saves
+every transaction - including mux channel selects - with its address,
+payload, response and outcome (e.g. NACK) into a compact binary trace.
+``ReplayI2C`` serves the recorded responses back in the same order without
+any hardware, so field issues can be reproduced offline and driver changes
+can be checked against captured crates::
+
+    kasli = record("crate.trace")  # hardware
+    kasli.discover_peripherals()
+    kasli._i2c.close()
+
+    kasli = KasliI2C(i2c=ReplayI2C("crate.trace"))  # offline
+    kasli.discover_peripherals()
+
+Trace format: a header (magic, version) followed by records, each a
+``<BBBHH`` header (operation, address, status, written and read length)
+followed by the written and read bytes. For failed transactions the read
+bytes hold the error message.
+
+* Author(s): Jakub Matyas
+"""
+
+import struct
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+TRACE_MAGIC = b"I2CT"
+TRACE_VERSION = 1
+
+OP_WRITE = 0
+OP_READ = 1
+OP_WRITE_READ = 2
+OP_SCAN = 3
+OP_NAMES = ("write", "read", "write_read", "scan")
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+_HEADER = struct.Struct("<4sB")
+_RECORD = struct.Struct("<BBBHH")
+
+
+class TraceRecord(NamedTuple):
+    op: int
+    address: int
+    status: int
+    data_out: bytes
+    data_in: bytes
+
+    def __str__(self) -> str:
+        s = f"{OP_NAMES[self.op]} 0x{self.address:02x}"
+        if self.data_out:
+            s += f" > {self.data_out.hex()}"
+        if self.status == STATUS_ERROR:
+            s += f" ! {self.data_in.decode(errors='replace')}"
+        elif self.data_in:
+            s += f" < {self.data_in.hex()}"
+        return s
+
+
+class TraceMismatchError(RuntimeError):
+    """Replayed transaction differs from the recorded one."""
+
+
+def write_record(f: BinaryIO, record: TraceRecord) -> None:
+    f.write(
+        _RECORD.pack(
+            record.op,
+            record.address,
+            record.status,
+            len(record.data_out),
+            len(record.data_in),
+        )
+    )
+    f.write(record.data_out)
+    f.write(record.data_in)
+
+
+def read_trace(filename: str) -> Iterator[TraceRecord]:
+    with open(filename, "rb") as f:
+        magic, version = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f"{filename} is not an I2C trace")
+        while True:
+            header = f.read(_RECORD.size)
+            if not header:
+                return
+            op, address, status, n_out, n_in = _RECORD.unpack(header)
+            yield TraceRecord(op, address, status, f.read(n_out), f.read(n_in))
+
+
+class RecordingI2C:
+    """Pass transactions through to ``i2c`` (the FTDI ``_I2C``) and record
+    them to ``filename``.
+    """
+
+    def __init__(self, i2c, filename: str) -> None:
+        self._i2c = i2c
+        self._file = open(filename, "wb")
+        self._file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+        self.count = 0
+
+    def _traced(self, op, address, data_out, data_in, func, *args, **kwargs):
+        # run func and record it, data_in() returns the bytes read
+        self.count += 1
+        try:
+            result = func(*args, **kwargs)
+        except OSError as e:
+            record = TraceRecord(op, address, STATUS_ERROR, data_out, str(e).encode())
+            write_record(self._file, record)
+            raise
+        write_record(
+            self._file, TraceRecord(op, address, STATUS_OK, data_out, data_in(result))
+        )
+        return result
+
+    def scan(self, write=False) -> List[int]:
+        return self._traced(OP_SCAN, 0, b"", bytes, self._i2c.scan, write)
+
+    def writeto(self, address, buffer, *, start=0, end=None, stop=True) -> None:
+        end = end if end else len(buffer)
+        self._traced(
+            OP_WRITE,
+            address,
+            bytes(buffer[start:end]),
+            lambda _: b"",
+            self._i2c.writeto,
+            address,
+            buffer,
+            start=start,
+            end=end,
+            stop=stop,
+        )
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None, stop=True) -> None:
+        end = end if end else len(buffer)
+        self._traced(
+            OP_READ,
+            address,
+            b"",
+            lambda _: bytes(buffer[start:end]),
+            self._i2c.readfrom_into,
+            address,
+            buffer,
+            start=start,
+            end=end,
+            stop=stop,
+        )
+
+    def writeto_then_readfrom(
+        self,
+        address,
+        buffer_out,
+        buffer_in,
+        *,
+        out_start=0,
+        out_end=None,
+        in_start=0,
+        in_end=None,
+        stop=False,
+    ) -> None:
+        out_end = out_end if out_end else len(buffer_out)
+        in_end = in_end if in_end else len(buffer_in)
+        self._traced(
+            OP_WRITE_READ,
+            address,
+            bytes(buffer_out[out_start:out_end]),
+            lambda _: bytes(buffer_in[in_start:in_end]),
+            self._i2c.writeto_then_readfrom,
+            address,
+            buffer_out,
+            buffer_in,
+            out_start=out_start,
+            out_end=out_end,
+            in_start=in_start,
+            in_end=in_end,
+            stop=stop,
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __getattr__(self, name):
+        # anything not traced (e.g. the pyftdi controller) of the wrapped bus
+        return getattr(self._i2c, name)
+
+
+class ReplayI2C:
+    """Serve transactions recorded by ``RecordingI2C`` in order.
+
+    With ``strict`` every transaction is checked against the recorded one
+    (operation, address, written data and read length) and a
+    ``TraceMismatchError`` is raised on the first difference.
+    """
+
+    def __init__(self, filename: str, strict: bool = True) -> None:
+        self._records = list(read_trace(filename))
+        self._index = 0
+        self.strict = strict
+        self.count = 0
+
+    @property
+    def remaining(self) -> int:
+        return len(self._records) - self._index
+
+    def _next(
+        self, op: int, address: int, data_out: bytes, n_in: Optional[int]
+    ) -> bytes:
+        if self._index >= len(self._records):
+            raise TraceMismatchError(
+                f"Trace exhausted at {OP_NAMES[op]} 0x{address:02x}"
+            )
+        record = self._records[self._index]
+        if self.strict and (
+            record.op != op
+            or record.address != address
+            or record.data_out != data_out
+            or (
+                record.status == STATUS_OK
+                and n_in is not None
+                and len(record.data_in) != n_in
+            )
+        ):
+            raise TraceMismatchError(
+                f"Transaction {self._index}: expected {record}, got "
+                f"{TraceRecord(op, address, STATUS_OK, data_out, b'')}"
+            )
+        self._index += 1
+        self.count += 1
+        if record.status == STATUS_ERROR:
+            raise OSError(record.data_in.decode(errors="replace"))
+        return record.data_in
+
+    def scan(self, write=False) -> List[int]:
+        return list(self._next(OP_SCAN, 0, b"", None))
+
+    def writeto(self, address, buffer, *, start=0, end=None, stop=True) -> None:
+        end = end if end else len(buffer)
+        self._next(OP_WRITE, address, bytes(buffer[start:end]), 0)
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None, stop=True) -> None:
+        end = end if end else len(buffer)
+        buffer[start:end] = self._next(OP_READ, address, b"", end - start)
+
+    def writeto_then_readfrom(
+        self,
+        address,
+        buffer_out,
+        buffer_in,
+        *,
+        out_start=0,
+        out_end=None,
+        in_start=0,
+        in_end=None,
+        stop=False,
+    ) -> None:
+        out_end = out_end if out_end else len(buffer_out)
+        in_end = in_end if in_end else len(buffer_in)
+        buffer_in[in_start:in_end] = self._next(
+            OP_WRITE_READ,
+            address,
+            bytes(buffer_out[out_start:out_end]),
+            in_end - in_start,
+        )
+
+    def close(self) -> None:
+        pass
+
+
+def record(filename: str, kasli_cls=None, **kwargs):
+    """Open a Kasli (``KasliI2C`` by default) recording all its transactions
+    to ``filename``; ``kwargs`` are passed to ``kasli_cls``.
+    """
+    from sinara_mgmt.kasli import KasliI2C, open_ftdi
+
+    if kasli_cls is None:
+        kasli_cls = KasliI2C
+    url = kwargs.pop("url", "ftdi://ftdi:4232:/2")
+    frequency = kwargs.pop("frequency", 100000)
+    i2c = RecordingI2C(open_ftdi(url, frequency), filename)
+    return kasli_cls(url=url, frequency=frequency, i2c=i2c, **kwargs)